@@ -0,0 +1,68 @@
+"""Import-time benchmark for pizzapi2.
+
+Each scenario runs in a fresh interpreter, is timed over several runs, and
+fails if it goes over its budget or imports a module it shouldn't need.
+Run it from the repository root:
+
+    python benchmarks/import_time.py
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+RUNS = 7
+
+SCENARIOS = {
+    # name: (code to time, time budget in ms, modules that must not be imported)
+    "import pizzapi2": (
+        "import pizzapi2",
+        50,
+        ["requests", "xmltodict", "attr", "fuzzywuzzy", "Levenshtein", "pizzapi2.menu"],
+    ),
+    "pizzapi2.track_by_order": (
+        "import pizzapi2; pizzapi2.track_by_order",
+        75,
+        ["requests", "xmltodict", "attr", "fuzzywuzzy", "Levenshtein", "pizzapi2.menu"],
+    ),
+    "pizzapi2.Menu": (
+        "import pizzapi2; pizzapi2.Menu",
+        400,
+        ["requests", "fuzzywuzzy", "Levenshtein"],
+    ),
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def run(code, forbidden):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(code=code, forbidden=forbidden)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    failed = False
+    for name, (code, budget, forbidden) in SCENARIOS.items():
+        results = [run(code, forbidden) for _ in range(RUNS)]
+        median = statistics.median(r["ms"] for r in results)
+        loaded = sorted({m for r in results for m in r["loaded"]})
+        ok = median <= budget and not loaded
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {median:.1f}ms (budget {budget}ms)"
+              + (f", unexpectedly imported {', '.join(loaded)}" if loaded else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
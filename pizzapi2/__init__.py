@@ -1,9 +1,83 @@
-from .address import Address
-from .coupon import Coupon
-from .customer import Customer
-from .menu import Menu
-from .order import Order
-from .payment import PaymentObject
-from .store import Store
-from .track import track_by_order, track_by_phone
-from .utils import request_json, request_xml
+"""pizzapi2 - a Python wrapper for the Dominos Pizza API.
+
+Submodules are only imported when one of their names is first used, so
+`import pizzapi2` is cheap and, say, `pizzapi2.track_by_order` never
+pulls in the menu parsing or fuzzy matching dependencies.
+"""
+import importlib
+import typing
+
+# Public name -> the submodule it lives in
+_exports = {
+    "Address": "address",
+    "Coupon": "coupon",
+    "CouponDetailService": "coupon",
+    "Customer": "customer",
+    "Menu": "menu",
+    "Order": "order",
+    "PriceRejected": "order",
+    "PaymentObject": "payment",
+    "Store": "store",
+    "track_by_order": "track",
+    "track_by_phone": "track",
+    "Deadline": "utils",
+    "request_json": "utils",
+    "request_xml": "utils",
+    "BatchSearch": "search",
+    "search_menus": "search",
+    "TypeAheadIndex": "search",
+    "PriceTable": "pricetable",
+    "Catalog": "catalog",
+    "load_menus": "bulk",
+    "parse_menus": "bulk",
+    "Limiter": "ratelimit",
+    "limiters": "ratelimit",
+    "LoadingCache": "cache",
+    "MenuCache": "cache",
+    "StoreCache": "cache",
+    "price_order_file": "pipeline",
+    "price_orders": "pipeline",
+    "Profiler": "profiling",
+    "profile": "profiling",
+    "MenuService": "service",
+    "serve": "service",
+    "best_carts": "optimizer",
+    "prewarm": "prefork",
+}
+
+__all__ = list(_exports)
+
+if typing.TYPE_CHECKING:
+    from .address import Address
+    from .coupon import Coupon, CouponDetailService
+    from .customer import Customer
+    from .menu import Menu
+    from .order import Order, PriceRejected
+    from .payment import PaymentObject
+    from .store import Store
+    from .track import track_by_order, track_by_phone
+    from .utils import Deadline, request_json, request_xml
+    from .search import BatchSearch, TypeAheadIndex, search_menus
+    from .pricetable import PriceTable
+    from .catalog import Catalog
+    from .bulk import load_menus, parse_menus
+    from .ratelimit import Limiter, limiters
+    from .profiling import Profiler, profile
+    from .cache import LoadingCache, MenuCache, StoreCache
+    from .pipeline import price_order_file, price_orders
+    from .service import MenuService, serve
+    from .optimizer import best_carts
+    from .prefork import prewarm
+
+
+def __getattr__(name: str):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value  # Only pay for the lookup once
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -47,7 +47,7 @@ class Address(object):
     def line2(self):
         return "{City}, {Region}, {PostalCode}".format(**self.data)
 
-    def nearby_stores(self, service="Delivery", ignore_closed=False):
+    def nearby_stores(self, service="Delivery", ignore_closed=False, deadline=None):
         """Query the API to find nearby stores.
 
         nearby_stores will filter the information we receive from the API
@@ -55,7 +55,12 @@ class Address(object):
         and stores that are not currently in service (!['ServiceIsOpen']).
         """
         data = request_json(
-            self.urls.find_url(), line1=self.line1, line2=self.line2, type=service
+            self.urls.find_url(),
+            deadline=deadline,
+            hedge=True,
+            line1=self.line1,
+            line2=self.line2,
+            type=service,
         )
         if not ignore_closed:
             return [
@@ -66,8 +71,8 @@ class Address(object):
         else:
             return [Store(x, self.country) for x in data["Stores"]]
 
-    def closest_store(self, service="Delivery", ignore_closed: bool = False):
-        stores = self.nearby_stores(service=service, ignore_closed=ignore_closed)
+    def closest_store(self, service="Delivery", ignore_closed: bool = False, deadline=None):
+        stores = self.nearby_stores(service=service, ignore_closed=ignore_closed, deadline=deadline)
         if not stores:
             raise Exception("No local stores are currently open")
         return stores[0]
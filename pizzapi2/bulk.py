@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import typing
+
+from .menu import Menu
+from .urls import Urls, COUNTRY_USA
+from .utils import request_raw
+
+
+def _parse(payload: typing.Union[bytes, bytearray, str], country: str, store_id: str, lang: str) -> Menu:
+    """Runs in a worker: decode and build one Menu."""
+    return Menu.from_menu_dict(
+        menu_data=json.loads(payload), country=country, store_id=store_id, lang=lang
+    )
+
+
+def parse_menus(
+    payloads: typing.Mapping[str, typing.Union[bytes, bytearray, str]],
+    country: str = COUNTRY_USA,
+    processes: typing.Optional[int] = None,
+    lang: str = "en",
+) -> typing.Dict[str, Menu]:
+    """Build many menus at once, one process per core.
+
+    payloads maps a store ID to the raw menu response body. JSON decoding
+    and Variant/Topping/Product.build_all run in the worker processes, and
+    finished menus come back pickled over the pool's result pipe. The
+    parent still has to unpickle every menu, which costs about 40% of a
+    full parse and happens one menu at a time, so this is at best around
+    2.5x faster than parsing in-process, however many cores there are.
+
+    If any payload fails to parse, its error is raised once the menus
+    already being parsed have finished; the rest are cancelled.
+    """
+    menus = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {
+            pool.submit(_parse, payload, country, str(store_id), lang): store_id
+            for store_id, payload in payloads.items()
+        }
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                menus[futures[future]] = future.result()
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+    return menus
+
+
+def load_menus(
+    store_ids: typing.Iterable[str],
+    lang: str = "en",
+    country: str = COUNTRY_USA,
+    processes: typing.Optional[int] = None,
+    fetch_workers: int = 8,
+    deadline=None,
+) -> typing.Dict[str, Menu]:
+    """Download the menus for store_ids on a thread pool, then parse_menus them."""
+    url = Urls(country).menu_url()
+    store_ids = list(store_ids)
+
+    def fetch(store_id: str) -> bytearray:
+        return request_raw(url, deadline=deadline, hedge=True, store_id=store_id, lang=lang)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers) as pool:
+        payloads = dict(zip(store_ids, pool.map(fetch, store_ids)))
+    return parse_menus(payloads, country=country, processes=processes, lang=lang)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import threading
+import typing
+
+from .menu import Menu
+from .urls import COUNTRY_USA
+from .utils import TTLCache
+
+if typing.TYPE_CHECKING:
+    from .address import Address
+    from .catalog import Catalog
+    from .store import Store
+
+
+class LoadingCache(TTLCache):
+    """A TTLCache that loads missing entries itself, and evicts the least
+    recently used entry once it's full.
+
+    Concurrent misses for the same key wait on a single load (a thundering
+    herd of requests for one store's menu makes one API call). Entries
+    expire ttl seconds after they were loaded.
+    """
+
+    def __init__(self, loader: typing.Callable[[typing.Hashable], typing.Any], maxsize: int = 256, ttl: float = 3600):
+        super().__init__(ttl=ttl, maxsize=maxsize)
+        self.loader = loader
+        self._loading: typing.Dict[typing.Hashable, threading.Lock] = {}
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._entry(key)
+            if entry is not self._missing:
+                self._data.move_to_end(key)
+            return entry
+
+    def get_or_load(self, key: typing.Hashable, loader: typing.Optional[typing.Callable] = None) -> typing.Any:
+        """The cached value for key, loading it (with loader, if given,
+        instead of the cache's own) if it's missing. get() is TTLCache's,
+        and never loads."""
+        entry = self._cached(key)
+        if entry is not self._missing:
+            return entry[1]
+        with self._lock:
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        with load_lock:
+            entry = self._cached(key)
+            if entry is not self._missing:
+                return entry[1]
+            try:
+                value = (loader or self.loader)(key)
+                self.set(key, value)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            return value
+
+
+class MenuCache(LoadingCache):
+    """Menus by store ID, shared between threads.
+
+    Menus are loaded with Menu.from_store on first use (through the Catalog,
+    if one is given), and must be treated as read-only by everyone sharing
+    them - Menu.order_product and friends already hand out copies.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 3600,
+        lang: str = "en",
+        country: str = COUNTRY_USA,
+        catalog: typing.Optional[Catalog] = None,
+    ):
+        def load(store_id) -> Menu:
+            return Menu.from_store(store_id=store_id, lang=lang, country=country, catalog=catalog)
+
+        super().__init__(load, maxsize=maxsize, ttl=ttl)
+
+    def get_or_load(self, store_id) -> Menu:
+        return super().get_or_load(str(store_id))
+
+
+class StoreCache(LoadingCache):
+    """The closest store to each address, so repeat addresses skip the locator."""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 600, service: str = "Delivery", ignore_closed: bool = False):
+        self.service = service
+        self.ignore_closed = ignore_closed
+
+        def load(key):
+            raise KeyError(f"StoreCache needs an Address to look up {key}")
+
+        super().__init__(load, maxsize=maxsize, ttl=ttl)
+
+    def get_or_load(self, address: Address) -> Store:
+        return super().get_or_load(
+            (str(address).casefold(), address.country),
+            loader=lambda _: address.closest_store(service=self.service, ignore_closed=self.ignore_closed),
+        )
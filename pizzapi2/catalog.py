@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import typing
+import weakref
+
+from .menu import Coupon, Menu, PreconfiguredProduct, Product, Side, Topping, Variant
+from .urls import COUNTRY_USA
+
+
+class _Group(dict):
+    """A per product type dict of toppings or sides (a dict that can be weakly referenced)."""
+
+
+def digest(data: typing.Any) -> bytes:
+    """A content address for a chunk of menu payload."""
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(encoded.encode(), digest_size=16).digest()
+
+
+class Catalog(object):
+    """Menu items shared between every store that carries them.
+
+    Each distinct Variant, Topping, Side, Product, Coupon and preconfigured
+    product is stored once, keyed by a hash of the payload it was built from.
+    A Menu built through the catalog is then just an overlay: its dicts
+    point at the shared objects, and only items that differ from other
+    stores (local items, different prices) get objects of their own.
+
+    A Product is only shared when its variants, and the toppings and sides
+    for its product type, are identical too, so a shared Product never
+    points at another store's prices.
+
+    Shared items must be treated as read-only. The Menu methods already
+    copy before handing anything out to be modified (order_product,
+    get_coupon, ...).
+
+    Items are held weakly, so they're dropped once no menu uses them.
+    """
+
+    def __init__(self):
+        self._items: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        # Per product type topping and side dicts, shared the same way
+        self._groups: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def intern(self, kind: str, key: bytes, factory: typing.Callable[[], typing.Any]):
+        with self._lock:
+            item = self._items.get((kind, key))
+            if item is None:
+                item = factory()
+                self._items[(kind, key)] = item
+            return item
+
+    def _group(self, kind: str, key: bytes, items: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        with self._lock:
+            group = self._groups.get((kind, key))
+            if group is None:
+                group = self._groups[(kind, key)] = _Group(items)
+            return group
+
+    def _build_grouped(
+        self, kind: str, groups_dict: typing.Dict[str, typing.Any], factory: typing.Callable
+    ) -> typing.Tuple[typing.Dict[str, typing.Dict[str, typing.Any]], typing.Dict[str, bytes]]:
+        ret = {}
+        group_keys = {}
+        for product_type, items in groups_dict.items():
+            group = {}
+            keys = []
+            for data in items.values():
+                key = digest(data)
+                item = self.intern(kind, key, lambda: factory(data))
+                group[item.code] = item
+                keys.append((item.code, key.hex()))
+            group_key = digest(sorted(keys))
+            ret[product_type] = self._group(kind, group_key, group)
+            group_keys[product_type] = group_key
+        return ret, group_keys
+
+    def build_menu(
+        self,
+        menu_data: typing.Dict[str, typing.Any],
+        country: str = COUNTRY_USA,
+        store_id: str = "",
+        lang: str = "en",
+    ) -> Menu:
+        """Menu.from_menu_dict, with every item taken from the catalog."""
+        variants = {}
+        variant_keys = {}
+        for data in menu_data["Variants"].values():
+            key = digest(data)
+            variant = self.intern("Variant", key, lambda: Variant.from_dict(variant_dict=data))
+            variants[variant.code] = variant
+            variant_keys[variant.code] = key.hex()
+
+        toppings, topping_keys = self._build_grouped(
+            "Topping", menu_data["Toppings"], lambda data: Topping.from_dict(topping_dict=data)
+        )
+        sides, side_keys = self._build_grouped(
+            "Side", menu_data["Sides"], lambda data: Side.from_dict(side_dict=data)
+        )
+
+        products = {}
+        shared = {}
+        for data in menu_data["Products"].values():
+            product_type = data["ProductType"]
+            key = digest(
+                [
+                    data,
+                    [variant_keys.get(code) for code in data["Variants"]],
+                    topping_keys.get(product_type, b"").hex(),
+                    side_keys.get(product_type, b"").hex(),
+                ]
+            )
+            product = self.intern(
+                "Product",
+                key,
+                lambda: Product.from_dict(
+                    product_dict=data,
+                    variants_dict=variants,
+                    toppings_dict=toppings,
+                    sides_dict=sides,
+                    shared=shared,
+                ),
+            )
+            products[product.code] = product
+
+        coupons = {}
+        for data in menu_data["Coupons"].values():
+            coupon = self.intern("Coupon", digest(data), lambda: Coupon.from_dict(coupon_dict=data))
+            coupons[coupon.code] = coupon
+
+        preconf_products = {}
+        for data in menu_data["PreconfiguredProducts"].values():
+            preconf_product = self.intern(
+                "PreconfiguredProduct",
+                digest(data),
+                lambda: PreconfiguredProduct.from_dict(preconf_product_dict=data),
+            )
+            preconf_products[preconf_product.code] = preconf_product
+
+        return Menu(
+            variants=variants,
+            products=products,
+            coupons=coupons,
+            preconfigured_products=preconf_products,
+            country=country,
+            all_toppings=toppings,
+            store_id=store_id,
+            lang=lang,
+        )
@@ -1,3 +1,10 @@
+import concurrent.futures
+import threading
+
+from .urls import Urls, COUNTRY_USA
+from .utils import Deadline, TTLCache, request_json
+
+
 class Coupon(object):
     """Loose representation of a coupon - no logic.
 
@@ -13,3 +20,86 @@ class Coupon(object):
         self.quantity = quantity
         self.id = 1
         self.is_new = True
+
+
+class CouponDetailService(object):
+    """Fetches full coupon details from the coupon endpoint.
+
+    The menu only carries a summary of each coupon. This looks up the rest
+    for many coupons at once, at most max_workers requests at a time, and
+    caches each result per (store, coupon, lang) for ttl seconds.
+    """
+
+    def __init__(self, country=COUNTRY_USA, ttl=3600, max_workers=8, maxsize=10000):
+        self.urls = Urls(country)
+        self.max_workers = max_workers
+        self.cache = TTLCache(ttl=ttl, maxsize=maxsize)
+
+    def get(self, store_id, coupon_code, lang="en", deadline=None):
+        key = (str(store_id), coupon_code, lang)
+        details = self.cache.get(key)
+        if details is None:
+            details = request_json(
+                self.urls.coupon_url(),
+                deadline=deadline,
+                hedge=True,
+                store_id=store_id,
+                couponid=coupon_code,
+                lang=lang,
+            )
+            self.cache.set(key, details)
+        return details
+
+    def get_many(self, store_id, coupon_codes, lang="en", deadline=None, on_error=None):
+        """Details for each of coupon_codes, as {code: details}.
+
+        A coupon the endpoint couldn't return (an HTTP or connection error,
+        after retries) is left out, and not cached, rather than failing the
+        whole batch; on_error, if given, is called with its code and the
+        error. Running out of deadline raises TimeoutError, as does any
+        other error.
+        """
+        import requests
+
+        deadline = Deadline.coerce(deadline)
+        coupon_codes = list(dict.fromkeys(coupon_codes))
+        ret = {}
+        missing = []
+        for code in coupon_codes:
+            details = self.cache.get((str(store_id), code, lang))
+            if details is None:
+                missing.append(code)
+            else:
+                ret[code] = details
+        if missing:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+            try:
+                futures = {
+                    pool.submit(self.get, store_id, code, lang, deadline): code
+                    for code in missing
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    code = futures[future]
+                    try:
+                        ret[code] = future.result()
+                    except requests.RequestException as e:
+                        if on_error is not None:
+                            on_error(code, e)
+            except BaseException:
+                # Don't start lookups no one will wait for
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            pool.shutdown()
+        return {code: ret[code] for code in coupon_codes if code in ret}
+
+
+_default_services = {}
+_default_services_lock = threading.Lock()
+
+
+def default_coupon_service(country=COUNTRY_USA):
+    """The shared CouponDetailService for a country, used by Menu.coupon_details."""
+    with _default_services_lock:
+        if country not in _default_services:
+            _default_services[country] = CouponDetailService(country=country)
+        return _default_services[country]
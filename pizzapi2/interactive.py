@@ -1,10 +1,12 @@
+import concurrent.futures
 import typing
 
-from .menu import ToppingAmount, ToppingCoverage, Menu, Variant, PreconfiguredProduct
+from .menu import ToppingAmount, ToppingCoverage, Menu, Variant, PreconfiguredProduct, Product
 from .order import Order
 from .customer import Customer
 from .address import Address
 from .payment import PaymentObject
+from .search import TypeAheadIndex
 from .utils import yesno
 from .store import Store
 
@@ -37,45 +39,197 @@ def build_address() -> Address:
     return a
 
 
+def start_menu_fetch(
+    address: Address, pool: concurrent.futures.Executor, ignore_closed: bool = True
+) -> "concurrent.futures.Future[typing.Tuple[Menu, Store, str]]":
+    """Find the closest store, then fetch its profile and menu side by side.
+
+    Runs on pool, so the caller can keep asking the customer questions in
+    the meantime; it only takes one of pool's workers (the profile is
+    fetched on a thread of its own), so any pool will do. The future
+    resolves to (menu, store, store description).
+    """
+
+    def fetch() -> typing.Tuple[Menu, Store, str]:
+        store = address.closest_store(ignore_closed=ignore_closed)
+        # Not on pool: waiting here for another of its workers could wait forever
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as side:
+            details = side.submit(store.details_str)
+            menu = store.get_menu()
+            return menu, store, details.result()
+
+    return pool.submit(fetch)
+
+
 def build_menu(address: Address, ignore_closed: bool = True) -> typing.Tuple[Menu, Store]:
     print(f"Getting the closest store to {address}...")
-    store = address.closest_store(ignore_closed=ignore_closed)
-    print(f"Found store! {store.details_str()}")
-    print("Fetching menu...")
-    return store.get_menu(), store
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        menu, store, details = start_menu_fetch(address, pool, ignore_closed=ignore_closed).result()
+    print(f"Found store! {details}")
+    return menu, store
+
+
+def print_categories(menu: Menu):
+    for product_type, products in menu.products_by_type.items():
+        print(f"{product_type} ({len(products)})")
+
+
+def print_category(menu: Menu, product_type: str):
+    products = menu.get_product_by_type(product_type)
+    if not products:
+        print(f"No products of type {product_type}")
+    for product in products:
+        print(f"[{product.code}] {product.pprint()}", end="")
+
+
+def print_matches(items: typing.List[typing.Union[Product, PreconfiguredProduct]]):
+    if not items:
+        print("No matches")
+    for item in items:
+        print(f"[{item.code}] {item.name}")
+
+
+def pick_toppings(product: Product) -> typing.List[typing.Tuple[str, ToppingCoverage, ToppingAmount]]:
+    """Toppings are entered as codes, e.g. "P, M:half, S:double"."""
+    print("Available toppings: " + ", ".join(
+        f"{code} ({topping.name})" for code, topping in product.available_toppings.items()
+    ))
+    while True:
+        toppings = []
+        for entry in input("Toppings (e.g. P, M:half, S:double): ").split(","):
+            code, *mods = [part.strip() for part in entry.split(":")]
+            if not code:
+                continue
+            coverage = ToppingCoverage.half if "half" in mods else ToppingCoverage.full
+            amount = ToppingAmount.double if "double" in mods else ToppingAmount.normal
+            toppings.append((code, coverage, amount))
+        missing = product.missing_toppings(code for code, _, _ in toppings)
+        if not missing:
+            return toppings
+        print(f"Not available for {product.name}: {', '.join(missing)}")
+
+
+def pick_qty() -> int:
+    qty = input("Quantity [1]: ").strip()
+    return int(qty) if qty.isdigit() and int(qty) > 0 else 1
+
+
+def add_item(menu: Menu, code: str) -> typing.Optional[typing.Union[Variant, PreconfiguredProduct]]:
+    if code in menu.preconfigured_products:
+        return menu.order_preconf_product(preconf_product_code=code, qty=pick_qty())
+    product = menu.products.get(code)
+    if product is None:
+        print(f"No product {code}")
+        return None
+    variants = list(product.variants.values())
+    for idx, variant in enumerate(variants):
+        print(f"{idx}: [{variant.code}] {variant.pprint()}")
+    choice = input("Variant #: ").strip()
+    if not choice.isdigit() or int(choice) >= len(variants):
+        print("No such variant")
+        return None
+    return menu.order_product(
+        product_code=product.code,
+        variant_code=variants[int(choice)].code,
+        toppings=pick_toppings(product),
+        qty=pick_qty(),
+    )
+
+
+def print_cart(cart: typing.List[typing.Union[Variant, PreconfiguredProduct]]):
+    if not cart:
+        print("Your order is empty")
+    for idx, item in enumerate(cart):
+        print(f"{idx}: {item.qty} x {item.name} [{item.code}] {item.options or ''}")
+
+
+HELP = """Commands:
+  c             list categories
+  c <type>      show a category
+  s <text>      search as you type - product names, codes and types
+  a <code>      add a product or preconfigured product to the order
+  r <#>         remove an item from the order
+  l             list the order
+  d             done
+"""
 
 
 def select_products(menu: Menu) -> typing.Tuple[typing.List[Variant], typing.List[PreconfiguredProduct]]:
-    # Show the whole menu, shortform, organized by product type
-    variants = []
-    preconf_products = []
-    # User choice: show category/show whole menu/add item to order/remove item from order/done
-    # Show category: dump category products to terminal, goto User Choice
-    # Show whole menu: dump whole menu to terminal, goto User Choice
-    # Add item: Input product code, input variant code, pick toppings, pick quantity. Add to order. Goto UserChoice
-    # Remove item: User chooses which to remove. Goto user choice
-    # Done: print order, ask user to confirm. Return if yes, goto UserChoice if no
+    index = TypeAheadIndex(menu)
+    cart: typing.List[typing.Union[Variant, PreconfiguredProduct]] = []
+    print(HELP)
+    while True:
+        command, _, arg = input("> ").strip().partition(" ")
+        arg = arg.strip()
+        if command == "c" and not arg:
+            print_categories(menu)
+        elif command == "c":
+            print_category(menu, arg)
+        elif command == "s":
+            print_matches(index.complete(arg))
+        elif command == "a" and arg:
+            try:
+                item = add_item(menu, arg)
+            except ValueError as e:
+                print(e)
+                item = None
+            if item is not None:
+                cart.append(item)
+        elif command == "r" and arg.isdigit() and int(arg) < len(cart):
+            cart.pop(int(arg))
+        elif command == "l":
+            print_cart(cart)
+        elif command == "d":
+            print_cart(cart)
+            print("Is this correct?")
+            if cart and yesno():
+                break
+        else:
+            print(HELP)
+    variants = [item for item in cart if isinstance(item, Variant)]
+    preconf_products = [item for item in cart if isinstance(item, PreconfiguredProduct)]
     return variants, preconf_products
 
 
+def build_card() -> typing.Optional[PaymentObject]:
+    print("Pay by card? (otherwise cash)")
+    if not yesno():
+        return None
+    while True:
+        card = PaymentObject(
+            number=input("Card Number: "),
+            expiration=input("Expiration (MMYY): "),
+            cvv=input("CVV: "),
+            zip=input("Billing Zip Code: "),
+        )
+        errors = card.errors()
+        if not errors:
+            return card
+        print(f"That card won't work: {', '.join(errors)}")
+
+
 def main():
-    customer = build_customer()
     address = build_address()
-    menu, store = build_menu(address=address)
-    variant = menu.order_product(product_code="S_PIZZA",
-                              variant_code="14SCREEN",
-                              toppings=[("S", ToppingCoverage.full, ToppingAmount.normal),
-                                        ("J", ToppingCoverage.full, ToppingAmount.normal),
-                                        ("M", ToppingCoverage.full, ToppingAmount.normal)])
-    coupon = menu.get_coupon(coupon_code="9012")
-    order = Order(store=store, customer=customer, address=address)
-    order.add_item(item=variant)
-    order.add_coupon(coupon=coupon)
-    return
-    card = PaymentObject('4815772389572640', '0529', '98123', '05401')
+    # Find the store and load its menu while the customer types in their details
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        menu_fetch = start_menu_fetch(address, pool)
+        customer = build_customer()
+        print("Fetching menu...")
+        menu, store, details = menu_fetch.result()
+    print(f"Ordering from {details}")
+    order = Order(store=store, customer=customer, address=address, menu=menu)
+    variants, preconf_products = select_products(menu)
+    for item in [*variants, *preconf_products]:
+        order.add_item(item=item)
+    card = build_card()
     response = order.pay_with(card)
-    # exit(0) if cli() else exit(1)
+    print(f"Total: ${order.data['Amounts'].get('Customer', 0)}")
+    print("Place the order?")
+    if yesno():
+        response = order.place(card)
+        print(f"Order placed! Status: {response.get('Status')}")
+    return response
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
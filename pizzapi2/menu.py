@@ -6,11 +6,34 @@ from enum import Enum
 import typing
 import attr
 import copy
+import functools
+import json
 
+from .profiling import stage
 from .urls import Urls, COUNTRY_USA
-from .utils import request_json
+from .utils import request_raw
 
-from fuzzywuzzy import fuzz
+if typing.TYPE_CHECKING:
+    from .catalog import Catalog
+    from .coupon import CouponDetailService
+
+
+class _ReadOnlyDict(dict):
+    """A dict that can't be changed after it's built, for the topping and
+    side mappings that products share (one change would reach every
+    product sharing it)."""
+
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # The default would rebuild it item by item, through __setitem__
+        return type(self), (dict(self),)
 
 
 def converter_splitlist(val: str) -> typing.List[str]:
@@ -24,6 +47,22 @@ def lazy_float_convert(val: str) -> float:
         return 0.0
 
 
+@functools.lru_cache(maxsize=4096)
+def parse_code_string(data: str) -> typing.Tuple[typing.Tuple[str, str], ...]:
+    """
+    Split a "X=1,C=1" style field into ((code, value), ...) pairs.
+
+    Most products on a menu (and across stores) share the same few strings,
+    so the result is cached per distinct string.
+    """
+    pairs = []
+    for item in data.split(","):
+        code, _, value = item.partition("=")
+        if code:
+            pairs.append((code, value))
+    return tuple(pairs)
+
+
 @attr.dataclass
 class MenuItem(ABC):
     code: str
@@ -75,12 +114,7 @@ class Side(MenuItem):
         """
         Default sides need to be parsed, again annoyingly
         """
-        sides = []
-        for side_data in ins.split(","):
-            side = side_data.split("=")[0]
-            if side:
-                sides.append(side)
-        return sides
+        return [side for side, _ in parse_code_string(ins)]
 
 
 class ToppingCoverage(Enum):
@@ -93,6 +127,17 @@ class ToppingAmount(Enum):
     double = "2"
 
 
+@attr.dataclass(frozen=True)
+class ToppingDefault(object):
+    """How a topping comes on a product by default, e.g. X=1 or P=1/2=1.5
+
+    These are kept as the API's strings - amounts like 0.5 and 1.5 have no
+    ToppingAmount.
+    """
+    coverage: str = ToppingCoverage.full.value
+    amount: str = ToppingAmount.normal.value
+
+
 @attr.dataclass
 class Topping(MenuItem):
     availability: list
@@ -134,12 +179,31 @@ class Topping(MenuItem):
         """
         The available/default toppings fields annoyingly need to be parsed out as such
         """
-        codes = []
-        for item in data.split(","):
-            code = item.split("=")[0]
-            if code:
-                codes.append(code)
-        return codes
+        return [code for code, _ in parse_code_string(data)]
+
+    @classmethod
+    def parse_defaults_from_product(cls, data: str) -> typing.Dict[str, ToppingDefault]:
+        """
+        The coverage/amount half of a DefaultToppings field, e.g. "X=1,C=1"
+        """
+        defaults = {}
+        for code, value in parse_code_string(data):
+            coverage, _, amount = value.rpartition("=")
+            defaults[code] = ToppingDefault(
+                coverage=coverage or ToppingCoverage.full.value,
+                amount=amount or ToppingAmount.normal.value,
+            )
+        return defaults
+
+    @classmethod
+    def parse_amounts_from_product(cls, data: str) -> typing.Dict[str, typing.Tuple[str, ...]]:
+        """
+        The allowed amounts half of an AvailableToppings field, e.g. "X=0:0.5:1:1.5"
+        """
+        return {
+            code: tuple(value.split(":")) if value else ()
+            for code, value in parse_code_string(data)
+        }
 
 
 @attr.dataclass
@@ -156,7 +220,8 @@ class Variant(MenuItem):
     prepared: bool = attr.field(converter=attr.converters.to_bool)
     pricing: typing.Dict[str, typing.Any]
     surcharge: float = attr.field(converter=float)
-    options: typing.Dict[typing.Any, typing.Any] = {}
+    # A factory, not {} - attrs would share one default dict between every variant
+    options: typing.Dict[typing.Any, typing.Any] = attr.field(factory=dict)
     qty: int = 1
 
     def pprint(self) -> str:
@@ -225,16 +290,23 @@ class Variant(MenuItem):
 
 @attr.dataclass(frozen=True)
 class Product(MenuItem):
-    available_toppings: typing.Dict[str, Topping]
-    available_sides: typing.Dict[str, Side]
-    default_toppings: typing.Dict[str, Topping]
-    default_sides: typing.Dict[str, Side]
+    available_toppings: typing.Mapping[str, Topping]
+    available_sides: typing.Mapping[str, Side]
+    default_toppings: typing.Mapping[str, Topping]
+    default_sides: typing.Mapping[str, Side]
     description: str
     image_code: str
     local: bool = attr.field(converter=attr.converters.to_bool)
     product_type: str
     tags: typing.Dict[str, typing.Any]
     variants: typing.Dict[str, Variant]
+    topping_defaults: typing.Mapping[str, ToppingDefault] = attr.field(factory=dict)
+    topping_amounts: typing.Mapping[str, typing.Tuple[str, ...]] = attr.field(factory=dict)
+    # Every topping code for this product type gets a bit, so a whole set of
+    # toppings can be checked against the product with a single AND.
+    topping_bits: typing.Mapping[str, int] = attr.field(factory=dict, repr=False, eq=False)
+    available_topping_mask: int = attr.field(default=0, repr=False)
+    default_topping_mask: int = attr.field(default=0, repr=False)
 
     def pprint(self) -> str:
         ret = f"{self.name}: ({self.product_type}) {self.description}\n"
@@ -242,6 +314,29 @@ class Product(MenuItem):
             ret = f"{ret}\t{variant.pprint()}\n"
         return ret
 
+    def topping_mask(self, topping_codes: typing.Iterable[str]) -> int:
+        """The bitmask for a set of topping codes. Codes this product type has
+        never heard of are set in the high bits, so they never validate."""
+        mask = 0
+        unknown = len(self.topping_bits)
+        for code in topping_codes:
+            bit = self.topping_bits.get(code)
+            if bit is None:
+                bit = 1 << unknown
+                unknown += 1
+            mask |= bit
+        return mask
+
+    def missing_toppings(self, topping_codes: typing.Iterable[str]) -> typing.List[str]:
+        """Which of topping_codes are not available for this product."""
+        topping_codes = list(topping_codes)
+        if not self.topping_mask(topping_codes) & ~self.available_topping_mask:
+            return []
+        return [code for code in topping_codes if code not in self.available_toppings]
+
+    def accepts_toppings(self, topping_codes: typing.Iterable[str]) -> bool:
+        return not self.topping_mask(topping_codes) & ~self.available_topping_mask
+
     @classmethod
     def from_dict(
         cls,
@@ -249,9 +344,52 @@ class Product(MenuItem):
         variants_dict: typing.Dict[str, Variant],
         toppings_dict: typing.Dict[str, typing.Dict[str, Topping]],
         sides_dict: typing.Dict[str, typing.Dict[str, Side]],
+        shared: typing.Optional[typing.Dict[typing.Tuple[str, ...], typing.Any]] = None,
     ) -> Product:
+        """
+        shared caches the topping/side mappings by the string they were
+        parsed from, so products with the same AvailableToppings etc. get
+        the same mapping - a read-only dict, so no one can change it under
+        every other product sharing it.
+        Product.build_all passes one per menu.
+        """
         variants = {}
         product_type = product_dict["ProductType"]
+        if shared is None:
+            shared = {}
+
+        def mapping(field: str, parse: typing.Callable, source: typing.Dict[str, typing.Dict[str, typing.Any]]):
+            key = (field, product_type, product_dict[field])
+            if key not in shared:
+                shared[key] = _ReadOnlyDict(
+                    {code: source[product_type][code] for code in parse(product_dict[field])}
+                )
+            return shared[key]
+
+        def parsed(field: str, parse: typing.Callable):
+            key = (field, product_dict[field])
+            if key not in shared:
+                shared[key] = _ReadOnlyDict(parse(product_dict[field]))
+            return shared[key]
+
+        # Bits go by sorted code, so the same set of toppings always gets the
+        # same bits, whichever store (or Catalog) the product came from.
+        bits_key = ("TOPPING_BITS", product_type)
+        if bits_key not in shared:
+            shared[bits_key] = _ReadOnlyDict({
+                code: 1 << idx
+                for idx, code in enumerate(sorted(toppings_dict.get(product_type, {})))
+            })
+        topping_bits = shared[bits_key]
+
+        def mask(field: str) -> int:
+            key = ("MASK", field, product_type, product_dict[field])
+            if key not in shared:
+                value = 0
+                for code in Topping.parse_codes_from_product(product_dict[field]):
+                    value |= topping_bits[code]
+                shared[key] = value
+            return shared[key]
 
         # Deal with variants
         for variant_code in product_dict["Variants"]:
@@ -259,27 +397,19 @@ class Product(MenuItem):
                 variants.update({variant_code: variants_dict[variant_code]})
 
         # Deal with toppings
-        avail_toppings = {}
-        for topping_code in Topping.parse_codes_from_product(
-            product_dict["AvailableToppings"]
-        ):
-            avail_toppings.update({topping_code: toppings_dict[product_type][topping_code]})
-        default_toppings = {}
-        for topping_code in Topping.parse_codes_from_product(
-            product_dict["DefaultToppings"]
-        ):
-            default_toppings.update({topping_code: toppings_dict[product_type][topping_code]})
+        avail_toppings = mapping("AvailableToppings", Topping.parse_codes_from_product, toppings_dict)
+        default_toppings = mapping("DefaultToppings", Topping.parse_codes_from_product, toppings_dict)
 
         # Deal with sides
-        avail_sides = {}
-        for side_code in product_dict["AvailableSides"].split(","):
-            if side_code:
-                avail_sides.update({side_code: sides_dict[product_type][side_code]})
-        default_sides = {}
-        for side_code in Side.parse_default_sides(product_dict["DefaultSides"]):
-            default_sides.update({side_code: sides_dict[product_type][side_code]})
+        avail_sides = mapping("AvailableSides", Side.parse_default_sides, sides_dict)
+        default_sides = mapping("DefaultSides", Side.parse_default_sides, sides_dict)
 
         return Product(
+            topping_defaults=parsed("DefaultToppings", Topping.parse_defaults_from_product),
+            topping_amounts=parsed("AvailableToppings", Topping.parse_amounts_from_product),
+            topping_bits=topping_bits,
+            available_topping_mask=mask("AvailableToppings"),
+            default_topping_mask=mask("DefaultToppings"),
             available_toppings=avail_toppings,
             available_sides=avail_sides,
             code=product_dict["Code"],
@@ -303,12 +433,14 @@ class Product(MenuItem):
         sides_dict: typing.Dict[str, typing.Dict[str, Side]],
     ) -> typing.Dict[str, Product]:
         ret = {}
+        shared = {}
         for data in products_dict.values():
             product = Product.from_dict(
                 product_dict=data,
                 variants_dict=variants_dict,
                 toppings_dict=toppings_dict,
                 sides_dict=sides_dict,
+                shared=shared,
             )
             ret.update({product.code: product})
         return ret
@@ -322,13 +454,14 @@ class Product(MenuItem):
         qty: int = 1,
     ) -> Variant:
         # TODO: Sides
+        missing = self.missing_toppings(topping_code for topping_code, _, _ in toppings)
+        if missing:
+            raise ValueError(
+                f"{', '.join(missing)} not available for {self.name} ({self.code})"
+            )
         variant = copy.deepcopy(self.variants[variant.code])  # Need a new copy of this
         variant.qty = qty
         for topping_code, topping_coverage, topping_amount in toppings:
-            if topping_code not in self.available_toppings.keys():
-                raise ValueError(
-                    f"{topping_code} is not available for {self.name} ({self.code})"
-                )
             variant.add_topping(
                 topping=self.available_toppings[topping_code], amount=topping_amount, coverage=topping_coverage
             )
@@ -341,9 +474,9 @@ class PreconfiguredProduct(MenuItem):
     size: str
     options: str
     referenced_product_code: str = ""
-    tags: typing.Dict[str, typing.Any] = {}
+    tags: typing.Dict[str, typing.Any] = attr.field(factory=dict)
     qty: int = 1
-    options: typing.Dict[str, typing.Any] = {}
+    options: typing.Dict[str, typing.Any] = attr.field(factory=dict)
 
     def to_dict(self) -> dict:
         return {
@@ -397,6 +530,8 @@ class Coupon(MenuItem):
     local: bool = attr.field(converter=attr.converters.to_bool)
     bundle: bool = attr.field(converter=attr.converters.to_bool)
     qty: int = 1
+    # The full coupon from the coupon endpoint, only filled in on request (Menu.get_coupon)
+    details: typing.Optional[typing.Dict[str, typing.Any]] = attr.field(default=None, eq=False, repr=False)
 
     def to_dict(self) -> typing.Dict[str, typing.Any]:
         return {
@@ -448,6 +583,8 @@ class Menu(object):
     preconfigured_products: typing.Dict[str, PreconfiguredProduct]
     _all_toppings: typing.Dict[str, typing.Dict[str, Topping]]
     country: str = COUNTRY_USA
+    store_id: str = ""
+    lang: str = "en"
 
     def order_product(
         self,
@@ -467,32 +604,113 @@ class Menu(object):
 
     def get_coupon(
         self,
-        coupon_code: str
+        coupon_code: str,
+        details: bool = False,
+        service: typing.Optional[CouponDetailService] = None,
+        deadline=None,
     ) -> Coupon:
-        return copy.deepcopy(self.coupons[coupon_code])
+        """A copy of the coupon, ready to add to an Order.
+
+        With details=True the copy's details are filled in from the coupon
+        endpoint (see CouponDetailService), which needs a menu built with a
+        store_id (Menu.from_store and Store.get_menu do that). If the
+        endpoint fails, so does this.
+        """
+        coupon = copy.deepcopy(self.coupons[coupon_code])
+        if details:
+            coupon.details = self._coupon_service(service).get(
+                self.store_id, coupon_code, lang=self.lang, deadline=deadline
+            )
+        return coupon
+
+    def _coupon_service(self, service: typing.Optional[CouponDetailService]) -> CouponDetailService:
+        if not self.store_id:
+            raise ValueError("Coupon details need a menu that knows its store_id")
+        if service is None:
+            from .coupon import default_coupon_service
+
+            service = default_coupon_service(self.country)
+        return service
+
+    def coupon_details(
+        self,
+        coupon_codes: typing.Optional[typing.Iterable[str]] = None,
+        service: typing.Optional[CouponDetailService] = None,
+        deadline=None,
+        on_error: typing.Optional[typing.Callable[[str, Exception], None]] = None,
+    ) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Full details for coupon_codes (default: every coupon on the menu),
+        fetched in one batch and cached by the service. Coupons that
+        couldn't be fetched are left out and passed to on_error (see
+        CouponDetailService.get_many).
+
+        Menu.coupons isn't filled in with details as it's read: that would
+        turn looking at a dict into a request per coupon. Ask for them here,
+        or with get_coupon(details=True).
+        """
+        service = self._coupon_service(service)
+        if coupon_codes is None:
+            coupon_codes = self.coupons.keys()
+        return service.get_many(self.store_id, coupon_codes, lang=self.lang, deadline=deadline, on_error=on_error)
 
     @classmethod
-    def from_store(cls, store_id, lang="en", country=COUNTRY_USA) -> Menu:
-        response = request_json(Urls(country).menu_url(), store_id=store_id, lang=lang)
-        return cls.from_menu_dict(menu_data=response)
+    def from_store(
+        cls, store_id, lang="en", country=COUNTRY_USA, deadline=None, catalog: typing.Optional[Catalog] = None
+    ) -> Menu:
+        with stage("menu.fetch"):
+            raw = request_raw(
+                Urls(country).menu_url(), deadline=deadline, hedge=True, store_id=store_id, lang=lang
+            )
+        with stage("menu.decode"):
+            response = json.loads(raw)
+        return cls.from_menu_dict(
+            menu_data=response, country=country, catalog=catalog, store_id=str(store_id), lang=lang
+        )
 
     @classmethod
     def from_menu_dict(
-        cls, menu_data: typing.Dict[str, typing.Any], country: str = COUNTRY_USA
+        cls,
+        menu_data: typing.Dict[str, typing.Any],
+        country: str = COUNTRY_USA,
+        catalog: typing.Optional[Catalog] = None,
+        store_id: str = "",
+        lang: str = "en",
     ):
-        variants = Variant.build_all(variants_dict=menu_data["Variants"])
-        toppings = Topping.build_all(toppings_dict=menu_data["Toppings"])
-        sides = Side.build_all(sides_dict=menu_data["Sides"])
-        products = Product.build_all(
-            products_dict=menu_data["Products"],
-            variants_dict=variants,
-            toppings_dict=toppings,
-            sides_dict=sides,
-        )
-        coupons = Coupon.build_all(coupons_dict=menu_data["Coupons"])
-        preconf_products = PreconfiguredProduct.build_all(
-            preconf_products_dict=menu_data["PreconfiguredProducts"]
-        )
+        """Build a Menu from the API's structured menu payload.
+
+        With a Catalog, items identical to ones already loaded for another
+        store are shared rather than built again (see Catalog).
+        """
+        if catalog is not None:
+            with stage("menu.catalog") as record:
+                menu = catalog.build_menu(menu_data=menu_data, country=country, store_id=store_id, lang=lang)
+                record.count = len(menu.variants) + len(menu.products)
+            return menu
+        with stage("menu.variants") as record:
+            variants = Variant.build_all(variants_dict=menu_data["Variants"])
+            record.count = len(variants)
+        with stage("menu.toppings") as record:
+            toppings = Topping.build_all(toppings_dict=menu_data["Toppings"])
+            record.count = sum(len(t) for t in toppings.values())
+        with stage("menu.sides") as record:
+            sides = Side.build_all(sides_dict=menu_data["Sides"])
+            record.count = sum(len(s) for s in sides.values())
+        with stage("menu.products") as record:
+            products = Product.build_all(
+                products_dict=menu_data["Products"],
+                variants_dict=variants,
+                toppings_dict=toppings,
+                sides_dict=sides,
+            )
+            record.count = len(products)
+        with stage("menu.coupons") as record:
+            coupons = Coupon.build_all(coupons_dict=menu_data["Coupons"])
+            record.count = len(coupons)
+        with stage("menu.preconfigured_products") as record:
+            preconf_products = PreconfiguredProduct.build_all(
+                preconf_products_dict=menu_data["PreconfiguredProducts"]
+            )
+            record.count = len(preconf_products)
         return Menu(
             variants=variants,
             products=products,
@@ -500,24 +718,69 @@ class Menu(object):
             preconfigured_products=preconf_products,
             country=country,
             all_toppings=toppings,
+            store_id=store_id,
+            lang=lang,
         )
 
+    def products_accepting(
+        self, topping_codes: typing.Iterable[str], product_type: typing.Optional[str] = None
+    ) -> typing.List[Product]:
+        """Every product that all of topping_codes can go on."""
+        topping_codes = list(topping_codes)
+        masks: typing.Dict[int, int] = {}  # Products of a type share one topping_bits
+        products = []
+        for product in self.products.values():
+            if product_type and product.product_type.casefold() != product_type.casefold():
+                continue
+            bits_id = id(product.topping_bits)
+            if bits_id not in masks:
+                masks[bits_id] = product.topping_mask(topping_codes)
+            if not masks[bits_id] & ~product.available_topping_mask:
+                products.append(product)
+        return products
+
+    def variants_accepting(
+        self, topping_codes: typing.Iterable[str], product_type: typing.Optional[str] = None
+    ) -> typing.List[Variant]:
+        """Every variant of every product that all of topping_codes can go on."""
+        return [
+            variant
+            for product in self.products_accepting(topping_codes, product_type=product_type)
+            for variant in product.variants.values()
+        ]
+
+    def half_and_half_toppings(self, left_product_code: str, right_product_code: str) -> typing.List[str]:
+        """The topping codes that are valid on both halves of a half-and-half."""
+        left = self.products[left_product_code]
+        right = self.products[right_product_code]
+        if left.topping_bits is not right.topping_bits and left.topping_bits != right.topping_bits:
+            return [code for code in left.available_toppings if code in right.available_toppings]
+        both = left.available_topping_mask & right.available_topping_mask
+        return [code for code, bit in left.topping_bits.items() if bit & both]
+
     @property
     def product_types(self) -> typing.List[str]:
-        prod_types = []
+        return list(self.products_by_type)
+
+    @functools.cached_property
+    def products_by_type(self) -> typing.Dict[str, typing.List[Product]]:
+        """Products grouped by product type, built once per menu."""
+        by_type: typing.Dict[str, typing.List[Product]] = {}
         for product in self.products.values():
-            if product.product_type not in prod_types:
-                prod_types.append(product.product_type)
-        return prod_types
+            by_type.setdefault(product.product_type, []).append(product)
+        return by_type
 
     def get_product_by_type(self, product_type: str) -> typing.List[Product]:
         products = []
-        for product in self.products.values():
-            if product.product_type.casefold() == product_type.casefold():
-                products.append(product)
+        for prod_type, prod_type_products in self.products_by_type.items():
+            if prod_type.casefold() == product_type.casefold():
+                products.extend(prod_type_products)
         return products
 
     def search(self, query: str, threshold: int) -> typing.List[Product]:
+        # fuzzywuzzy (and Levenshtein) are slow to import, and most users never search
+        from fuzzywuzzy import fuzz
+
         products = []
         # Check the name, description, type for normal products
         for product in self.products.values():
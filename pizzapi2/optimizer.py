@@ -0,0 +1,221 @@
+"""Find the cheapest carts that feed a group, e.g. 12 people for under $60.
+
+Every variant is an item with a price (price + surcharge, at the menu's
+list price) and a number of people it feeds, and carts are found by an
+unbounded knapsack over people fed. Only the cheapest few variants of
+each product type and size are considered, which keeps a full menu down
+to a handful of choices.
+
+Coupons aren't knapsack items - the menu doesn't say what a coupon
+covers, only what it costs - so list prices are an upper bound. Pass
+coupon codes to confirm() and the price API applies them to each
+finalist, which is also the only way to know the real total with tax
+and delivery.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import re
+import typing
+
+import attr
+
+from .menu import Menu, Product, Variant
+from .order import Order, PriceRejected
+
+if typing.TYPE_CHECKING:
+    from .address import Address
+    from .customer import Customer
+    from .store import Store
+
+# Rough people fed, by size code
+PIZZA_SERVINGS = {"10": 2, "12": 3, "14": 4, "16": 5}
+# One person per this many pieces, for size codes like 8PCW
+PIECES_PER_SERVING = 4
+_PIECES = re.compile(r"^([0-9]+)PC")
+
+
+def default_servings(product: Product, variant: Variant) -> int:
+    """How many people a variant feeds; 0 leaves it out (drinks, dips...)."""
+    if product.product_type == "Pizza":
+        return PIZZA_SERVINGS.get(variant.size_code, 0)
+    if product.product_type == "Wings":
+        pieces = _PIECES.match(variant.size_code)
+        return int(pieces.group(1)) // PIECES_PER_SERVING if pieces else 0
+    if product.product_type in ("Sandwich", "Pasta"):
+        return 1
+    return 0
+
+
+@attr.dataclass(frozen=True)
+class CartItem(object):
+    product_code: str
+    variant_code: str
+    name: str
+    qty: int
+    price: float
+    servings: int
+
+
+@attr.dataclass(frozen=True)
+class Cart(object):
+    items: typing.Tuple[CartItem, ...]
+    total: float
+    servings: int
+    # Filled in by confirm(): the price API's total, and its full response
+    confirmed_total: typing.Optional[float] = None
+    response: typing.Optional[typing.Dict[str, typing.Any]] = attr.field(default=None, eq=False, repr=False)
+
+    def order_items(self, menu: Menu) -> typing.List[Variant]:
+        """The cart as Variants, ready for Order.add_item."""
+        return [
+            menu.order_product(product_code=item.product_code, variant_code=item.variant_code, toppings=[], qty=item.qty)
+            for item in self.items
+        ]
+
+
+class _Option(object):
+    __slots__ = ("product", "variant", "cents", "servings")
+
+    def __init__(self, product: Product, variant: Variant, cents: int, servings: int):
+        self.product = product
+        self.variant = variant
+        self.cents = cents
+        self.servings = servings
+
+
+def _options(
+    menu: Menu,
+    servings: typing.Callable[[Product, Variant], int],
+    product_types: typing.Optional[typing.Collection[str]],
+    per_group: int,
+) -> typing.List[_Option]:
+    """The per_group cheapest variants of each (product type, size)."""
+    groups: typing.Dict[typing.Tuple[str, str], typing.List[_Option]] = {}
+    for product in menu.products.values():
+        if product_types is not None and product.product_type not in product_types:
+            continue
+        for variant in product.variants.values():
+            fed = servings(product, variant)
+            cents = round((variant.price + variant.surcharge) * 100)
+            if fed <= 0 or cents <= 0:
+                continue
+            groups.setdefault((product.product_type, variant.size_code), []).append(
+                _Option(product, variant, cents, fed)
+            )
+    options = []
+    for group in groups.values():
+        group.sort(key=lambda option: (option.cents, -option.servings, option.variant.code))
+        options.extend(group[:per_group])
+    return options
+
+
+def best_carts(
+    menu: Menu,
+    people: int,
+    budget: typing.Optional[float] = None,
+    top: int = 5,
+    servings: typing.Callable[[Product, Variant], int] = default_servings,
+    product_types: typing.Optional[typing.Collection[str]] = None,
+    max_items: typing.Optional[int] = None,
+) -> typing.List[Cart]:
+    """The top cheapest carts (at list price) that feed at least people,
+    cheapest first, all within budget if one is given.
+
+    servings says how many people a variant feeds (see default_servings),
+    product_types limits the search to those types, and max_items caps the
+    number of items in a cart.
+    """
+    if people <= 0:
+        raise ValueError("people must be positive")
+    budget_cents = round(budget * 100) if budget is not None else None
+    options = _options(menu, servings, product_types, per_group=top)
+
+    # best[fed] holds the top cheapest (cents, item count, option counts)
+    # that feed exactly fed people - or, for best[people], at least that
+    # many. Looping over options on the outside counts every cart once,
+    # whatever order its items are added in.
+    best: typing.List[typing.List[typing.Tuple[int, int, typing.Tuple[int, ...]]]] = [[] for _ in range(people + 1)]
+    best[0] = [(0, 0, ())]
+    for idx, option in enumerate(options):
+        for fed in range(people):
+            if not best[fed]:
+                continue
+            target = min(people, fed + option.servings)
+            candidates = list(best[target])
+            for cents, count, cart in best[fed]:
+                cents += option.cents
+                if budget_cents is not None and cents > budget_cents:
+                    continue
+                if max_items is not None and count >= max_items:
+                    continue
+                candidates.append((cents, count + 1, cart + (idx,)))
+            candidates.sort()
+            best[target] = candidates[:top]
+
+    carts = []
+    for cents, _, cart in best[people]:
+        items = []
+        for idx in sorted(set(cart)):
+            option = options[idx]
+            qty = cart.count(idx)
+            items.append(
+                CartItem(
+                    product_code=option.product.code,
+                    variant_code=option.variant.code,
+                    name=option.variant.name,
+                    qty=qty,
+                    price=option.cents / 100,
+                    servings=option.servings * qty,
+                )
+            )
+        carts.append(Cart(items=tuple(items), total=cents / 100, servings=sum(item.servings for item in items)))
+    return carts
+
+
+def confirm(
+    carts: typing.Iterable[Cart],
+    menu: Menu,
+    store: Store,
+    customer: Customer,
+    address: Address,
+    coupons: typing.Iterable[str] = (),
+    max_workers: int = 4,
+    on_rejected: typing.Optional[typing.Callable[[Cart, Exception], None]] = None,
+) -> typing.List[Cart]:
+    """Price each cart with the price API (with coupons applied), cheapest
+    first.
+
+    Carts the API rejects (Status -1, or an HTTP error) are dropped, and
+    on_rejected, if given, is called with each one and the error saying
+    why. Anything else - an unknown coupon code is a KeyError, checked
+    before any request is sent - is raised.
+    """
+    import requests
+
+    coupons = list(coupons)
+    unknown = [code for code in coupons if code not in menu.coupons]
+    if unknown:
+        raise KeyError(f"Coupons not on the menu: {', '.join(unknown)}")
+
+    def price(cart: Cart) -> Cart:
+        order = Order(store=store, customer=customer, address=address, country=address.country, menu=menu)
+        for item in cart.order_items(menu):
+            order.add_item(item)
+        for coupon_code in coupons:
+            order.add_coupon(menu.get_coupon(coupon_code))
+        response = order.pay_with()
+        total = float(order.data.get("Amounts", {}).get("Customer", cart.total))
+        return attr.evolve(cart, confirmed_total=total, response=response)
+
+    confirmed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(cart, pool.submit(price, cart)) for cart in carts]
+        for cart, future in futures:
+            try:
+                confirmed.append(future.result())
+            except (PriceRejected, requests.HTTPError) as e:
+                if on_rejected is not None:
+                    on_rejected(cart, e)
+    confirmed.sort(key=lambda cart: cart.confirmed_total)
+    return confirmed
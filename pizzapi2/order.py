@@ -1,10 +1,23 @@
+import concurrent.futures
+import json
+import threading
 import typing
 
-import requests
-
 from .menu import Menu, Variant, Coupon, PreconfiguredProduct
 from .payment import PaymentObject
+from .profiling import stage
+from .ratelimit import limiters
 from .urls import Urls, COUNTRY_USA
+from .utils import Deadline, DEFAULT_TIMEOUT
+
+
+class PriceRejected(Exception):
+    """The price API didn't accept the order (Status -1). .result is its
+    response, which says why."""
+
+    def __init__(self, result: dict):
+        super().__init__("get price failed: %r" % result)
+        self.result = result
 
 
 # TODO: Add add_coupon and remove_coupon methods
@@ -14,16 +27,41 @@ class Order(object):
     The Order is perhaps the second most complicated class - it wraps
     up all the logic for actually placing the order, after we've
     determined what we want from the Menu.
+
+    With speculate=True, every change to the cart (add_item, add_coupon,
+    remove_coupon) prices the order in the background once the cart has
+    been left alone for speculate_delay seconds. If nothing has changed by
+    the time pay_with or place is called, that price is reused instead of
+    asking again, so checkout usually costs just the place request.
     """
-    def __init__(self, store, customer, address, country=COUNTRY_USA):
+    def __init__(
+        self,
+        store,
+        customer,
+        address,
+        country=COUNTRY_USA,
+        deadline=None,
+        menu: typing.Optional[Menu] = None,
+        speculate: bool = False,
+        speculate_delay: float = 0.5,
+    ):
         self.store = store
-        self.menu = Menu.from_store(store_id=store.id, country=country)
+        # Pass the menu in if you've already got it, to save fetching it again
+        self.menu = menu if menu is not None else Menu.from_store(store_id=store.id, country=country, deadline=deadline)
         self.customer = customer
         self.address = address
         self.urls = Urls(country)
         self.variants: typing.List[Variant] = []
         self.preconf_products: typing.List[PreconfiguredProduct] = []
         self.coupons: typing.List[Coupon] = []
+        self.speculate = speculate
+        self.speculate_delay = speculate_delay
+        # Bumped on every cart change; a speculative price is only used if
+        # it was requested for the current version
+        self._version = 0
+        self._speculation: typing.Optional[typing.Tuple[int, concurrent.futures.Future]] = None
+        self._timer: typing.Optional[threading.Timer] = None
+        self._lock = threading.Lock()
         self.data = {
             "Address": {
                 "Street": self.address.street,
@@ -59,23 +97,74 @@ class Order(object):
             "AmountsBreakdown": {},
         }
 
-    def _populate_order(self):
-        for variant in self.variants:
-            variant_dict = variant.to_dict()
-            variant_dict.update(
+    def _cart(self) -> typing.Tuple[typing.List[dict], typing.List[dict]]:
+        """The products and coupons, as the API wants them."""
+        products = []
+        for item in [*self.variants, *self.preconf_products]:
+            item_dict = item.to_dict()
+            item_dict.update(
                 ID=1, isNew=True, AutoRemove=False
             )
-            self.data["Products"].append(variant_dict)
-        for preconf_prod in self.preconf_products:
-            preconf_dict = preconf_prod.to_dict()
-            preconf_dict.update(
-                ID=1, isNew=True, AutoRemove=False
-            )
-            self.data["Products"].append(preconf_dict)
+            products.append(item_dict)
+        coupons = []
         for coupon in self.coupons:
             coupon_dict = coupon.to_dict()
             coupon_dict.update(ID=1, isNew=True, Qty=1, AutoRemove=False)
-            self.data["Coupons"].append(coupon_dict)
+            coupons.append(coupon_dict)
+        return products, coupons
+
+    def _populate_order(self):
+        # Rebuilt from scratch, so pricing twice doesn't order everything twice
+        self.data["Products"], self.data["Coupons"] = self._cart()
+
+    def _cart_changed(self):
+        with self._lock:
+            self._version += 1
+            if not self.speculate:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            if self._speculation is not None:
+                self._speculation[1].cancel()
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            self._speculation = (self._version, future)
+            self._timer = threading.Timer(self.speculate_delay, self._speculative_price, (self._version, future))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _speculative_price(self, version: int, future: concurrent.futures.Future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with self._lock:
+                if version != self._version:
+                    future.set_result(None)
+                    return
+                # Price a copy, so checkout can go on using self.data meanwhile
+                data = dict(self.data)
+                data["Products"], data["Coupons"] = self._cart()
+            future.set_result(self._send(self.urls.price_url(), False, data=data))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _speculative_response(self, deadline: typing.Optional[Deadline]) -> typing.Optional[dict]:
+        """The background price for the cart as it is now, if there is one
+        (waiting for it if it's in flight). None means price it again."""
+        with self._lock:
+            if self._speculation is None or self._speculation[0] != self._version:
+                return None
+            future = self._speculation[1]
+            if future.cancel():
+                # Still waiting out the delay - quicker to just ask now
+                return None
+        try:
+            response = future.result(timeout=deadline.remaining() if deadline else None)
+        except Exception:
+            return None
+        if not response or response.get("Status") == -1:
+            return None
+        with self._lock:
+            return response if self._speculation == (self._version, future) else None
 
     def add_item(self, item: typing.Union[PreconfiguredProduct, Variant]):
         if isinstance(item, PreconfiguredProduct):
@@ -84,6 +173,7 @@ class Order(object):
             self.variants.append(item)
         else:
             raise ValueError(f"Cannot add item {item} of type {type(item)} to order")
+        self._cart_changed()
 
     # # TODO: Implement item options
     # # TODO: Add exception handling for KeyErrors
@@ -101,6 +191,7 @@ class Order(object):
 
     def add_coupon(self, coupon: Coupon):
         self.coupons.append(coupon)
+        self._cart_changed()
 
     # def add_coupon(self, code, qty=1):
     #     item = self.menu.variants[code]
@@ -111,14 +202,19 @@ class Order(object):
     def remove_coupon(self, coupon: Coupon):
         if coupon not in self.coupons:
             raise ValueError(f"{coupon} not in coupons")
-        return self.coupons.pop(self.coupons.index(coupon))
+        removed = self.coupons.pop(self.coupons.index(coupon))
+        self._cart_changed()
+        return removed
 
     # def remove_coupon(self, code):
     #     codes = [x["Code"] for x in self.data["Coupons"]]
     #     return self.data["Coupons"].pop(codes.index(code))
 
-    def _send(self, url, merge):
-        self.data.update(
+    def _send(self, url, merge, deadline: typing.Optional[Deadline] = None, data: typing.Optional[dict] = None):
+        import requests
+
+        data = self.data if data is None else data
+        data.update(
             StoreID=self.store.id,
             Email=self.customer.email,
             FirstName=self.customer.first_name,
@@ -127,7 +223,7 @@ class Order(object):
         )
 
         for key in ("Products", "StoreID", "Address"):
-            if key not in self.data or not self.data[key]:
+            if key not in data or not data[key]:
                 raise Exception('order has invalid value for key "%s"' % key)
 
         headers = {
@@ -135,36 +231,72 @@ class Order(object):
             "Content-Type": "application/json",
         }
 
-        r = requests.post(url=url, headers=headers, json={"Order": self.data})
-        r.raise_for_status()
-        json_data = r.json()
+        with stage("order.encode") as record:
+            body = json.dumps({"Order": data})
+            record.count = len(body)
+
+        # Price and place are never hedged or retried - a duplicate place-order
+        # is a duplicate pizza.
+        timeout = deadline.timeout() if deadline else DEFAULT_TIMEOUT
+        with stage("order.network"), limiters.for_url(url).slot(
+            timeout=deadline.remaining() if deadline else None
+        ) as slot:
+            r = requests.post(url=url, headers=headers, data=body, timeout=timeout)
+            slot.status = r.status_code
+            r.raise_for_status()
+            json_data = r.json()
 
         if merge:
+            self._merge(json_data)
+        return json_data
+
+    def _merge(self, json_data):
+        with stage("order.merge") as record:
             for key, value in json_data["Order"].items():
                 if value or not isinstance(value, list):
                     self.data[key] = value
-        return json_data
+            record.count = len(json_data["Order"])
 
     # TODO: Figure out if this validates anything that self.urls.price_url() does not
-    def validate(self):
-        response = self._send(self.urls.validate_url(), True)
+    def validate(self, deadline=None):
+        response = self._send(self.urls.validate_url(), True, Deadline.coerce(deadline))
         return response["Status"] != -1
 
     # TODO: Actually test this
-    def place(self, card: typing.Optional[PaymentObject] = None):
-        self.pay_with(card)
-        response = self._send(self.urls.place_url(), False)
+    def place(self, card: typing.Optional[PaymentObject] = None, deadline=None):
+        """Price and place the order.
+
+        deadline (a Deadline or a number of seconds) covers both the price
+        and the place request.
+        """
+        deadline = Deadline.coerce(deadline)
+        self.pay_with(card, deadline=deadline)
+        response = self._send(self.urls.place_url(), False, deadline)
         return response
 
-    # TODO: Add self.price() and update whenever called and items were changed
-    def pay_with(self, card: typing.Optional[PaymentObject] = None):
-        """Use this instead of self.place when testing"""
+    def pay_with(self, card: typing.Optional[PaymentObject] = None, deadline=None):
+        """Use this instead of self.place when testing
+
+        Reuses the speculative price, if there is one for the current cart.
+        """
+        # Don't make the round trip for a card we can already tell is bad
+        if card is not None:
+            errors = card.errors()
+            if errors:
+                raise ValueError(f"invalid card: {', '.join(errors)}")
         # get the price to check that everything worked okay
-        self._populate_order()
-        response = self._send(self.urls.price_url(), True)
+        with stage("order.populate") as record:
+            self._populate_order()
+            record.count = len(self.variants) + len(self.preconf_products) + len(self.coupons)
+        deadline = Deadline.coerce(deadline)
+        response = self._speculative_response(deadline) if self.speculate else None
+        if response is not None:
+            self._merge(response)
+        else:
+            response = self._send(self.urls.price_url(), True, deadline)
 
         if response["Status"] == -1:
-            raise Exception("get price failed: %r" % response)
+            raise PriceRejected(response)
 
         if not card:
             self.data["Payments"] = [
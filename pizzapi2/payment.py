@@ -1,4 +1,59 @@
+import datetime
 import re
+import typing
+
+_CVV = re.compile(r"^[0-9]{3,4}$")
+_ZIP = re.compile(r"^[0-9]{5}(?:-[0-9]{4})?$")
+_EXPIRATION = re.compile(r"^(0[1-9]|1[0-2])/?([0-9]{2})$")
+
+# Card type by number length, then by prefix. Same rules as the regexes
+# these replaced, e.g. VISA was ^4[0-9]{12}(?:[0-9]{3})?$ - starts with 4,
+# 13 or 16 digits.
+_CARD_RULES = (
+    ("VISA", ("4",), (13, 16)),
+    ("MASTERCARD", ("51", "52", "53", "54", "55"), (16,)),
+    ("AMEX", ("34", "37"), (15,)),
+    ("DINERS", ("300", "301", "302", "303", "304", "305", "36", "38"), (14,)),
+    ("DISCOVER", ("6011", "65"), (16,)),
+    ("JCB", ("2131", "1800"), (15,)),
+    ("JCB", ("35",), (16,)),
+    ("ENROUTE", ("2014", "2149"), (15,)),
+)
+_CARD_TYPES: typing.Dict[int, typing.Dict[str, str]] = {}
+for _card_type, _prefixes, _lengths in _CARD_RULES:
+    for _length in _lengths:
+        for _prefix in _prefixes:
+            _CARD_TYPES.setdefault(_length, {})[_prefix] = _card_type
+_MAX_PREFIX = max(len(prefix) for _, prefixes, _ in _CARD_RULES for prefix in prefixes)
+
+
+def card_type(number: str) -> str:
+    """The card type for a card number, or "" if it isn't one we know."""
+    if not (number.isascii() and number.isdigit()):
+        return ""
+    by_prefix = _CARD_TYPES.get(len(number))
+    if not by_prefix:
+        return ""
+    for length in range(_MAX_PREFIX, 0, -1):
+        found = by_prefix.get(number[:length])
+        if found:
+            return found
+    return ""
+
+
+def luhn_valid(number: str) -> bool:
+    """The Luhn (mod 10) checksum every real card number passes."""
+    if not (number.isascii() and number.isdigit()):
+        return False
+    total = 0
+    for idx, digit in enumerate(reversed(number)):
+        value = ord(digit) - 48
+        if idx % 2:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return total % 10 == 0
 
 
 class PaymentObject(object):
@@ -16,27 +71,38 @@ class PaymentObject(object):
         self.cvv = str(cvv).strip()
         self.zip = str(zip).strip()
 
-    def validate(self):
-        is_valid = self.number and self.card_type and self.expiration
-        is_valid &= re.match(r"^[0-9]{3,4}$", self.cvv)
-        is_valid &= re.match(r"^[0-9]{5}(?:-[0-9]{4})?$", self.zip)
-        return is_valid
+    def errors(self, today: typing.Optional[datetime.date] = None) -> typing.List[str]:
+        """Everything wrong with this card that we can tell without asking
+        the API. Expiration is MMYY (or MM/YY)."""
+        errors = []
+        if not self.card_type:
+            errors.append("unrecognized card number")
+        elif not luhn_valid(self.number):
+            errors.append("card number fails checksum")
+        expiration = _EXPIRATION.match(self.expiration)
+        if not expiration:
+            errors.append("expiration should be MMYY")
+        else:
+            today = today or datetime.date.today()
+            month, year = int(expiration.group(1)), 2000 + int(expiration.group(2))
+            if (year, month) < (today.year, today.month):
+                errors.append("card has expired")
+        if not _CVV.match(self.cvv):
+            errors.append("CVV should be 3 or 4 digits")
+        if not _ZIP.match(self.zip):
+            errors.append("billing zip should be 5 or 9 digits")
+        return errors
+
+    def validate(self, today: typing.Optional[datetime.date] = None) -> bool:
+        return not self.errors(today=today)
+
+    @classmethod
+    def validate_many(
+        cls, payments: typing.Iterable["PaymentObject"]
+    ) -> typing.List[typing.List[str]]:
+        """errors() for many cards at once; an empty list means valid."""
+        today = datetime.date.today()
+        return [payment.errors(today=today) for payment in payments]
 
     def find_type(self):
-        patterns = {
-            "VISA": r"^4[0-9]{12}(?:[0-9]{3})?$",
-            "MASTERCARD": r"^5[1-5][0-9]{14}$",
-            "AMEX": r"^3[47][0-9]{13}$",
-            "DINERS": r"^3(?:0[0-5]|[68][0-9])[0-9]{11}$",
-            "DISCOVER": r"^6(?:011|5[0-9]{2})[0-9]{12}$",
-            "JCB": r"^(?:2131|1800|35\d{3})\d{11}$",
-            "ENROUTE": r"^(?:2014|2149)\d{11}$",
-        }
-        return next(
-            (
-                card_type
-                for card_type, pattern in list(patterns.items())
-                if re.match(pattern, self.number)
-            ),
-            "",
-        )
+        return card_type(self.number)
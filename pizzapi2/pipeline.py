@@ -0,0 +1,252 @@
+"""Streaming import and pricing of batch orders.
+
+Orders are read one at a time from a JSONL or CSV file, priced with
+bounded concurrency, and written to a JSONL results file as they finish.
+A checkpoint file records which input records are done, so a crashed run
+can be resumed without pricing anything twice. Memory stays flat: only
+the orders in flight (and the cached stores and menus) are held at once.
+
+A JSONL record looks like:
+
+    {"id": "catering-17",
+     "customer": {"fname": "Bernie", "lname": "Sanders", "email": "...", "phone": "..."},
+     "address": {"street": "1 Church St.", "city": "Burlington", "region": "VT", "zip": "05401"},
+     "store_id": "4336",  # optional, otherwise the closest store
+     "items": [{"product": "S_PIZZA", "variant": "14SCREEN", "qty": 2,
+                "toppings": [["P", "full", "normal"], ["M", "half", "double"]]},
+               {"preconf": "14SCEXTRAV"}],
+     "coupons": ["9012"],
+     "card": {"number": "...", "expiration": "MMYY", "cvv": "...", "zip": "..."}}  # optional, otherwise cash
+
+CSV files have one column per customer/address field (fname, lname,
+email, phone, street, city, region, zip), plus optional id and store_id
+columns. The items, coupons and (optional) card columns hold the same
+values as JSON.
+
+Cards are checked locally (PaymentObject.errors) before an order goes
+anywhere near the network.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import csv
+import json
+import os
+import threading
+import typing
+
+from .address import Address
+from .cache import MenuCache, StoreCache
+from .customer import Customer
+from .menu import Menu, ToppingAmount, ToppingCoverage
+from .order import Order
+from .payment import PaymentObject
+from .store import Store
+
+_CUSTOMER_FIELDS = ("fname", "lname", "email", "phone")
+_ADDRESS_FIELDS = ("street", "city", "region", "zip")
+
+
+def _csv_record(row: typing.Dict[str, str]) -> typing.Dict[str, typing.Any]:
+    return {
+        "id": row.get("id") or None,
+        "customer": {field: row.get(field, "") for field in _CUSTOMER_FIELDS},
+        "address": {field: row.get(field, "") for field in _ADDRESS_FIELDS},
+        "store_id": row.get("store_id") or None,
+        "items": json.loads(row.get("items") or "[]"),
+        "coupons": json.loads(row.get("coupons") or "[]"),
+        "card": json.loads(row.get("card") or "null"),
+    }
+
+
+def read_orders(path: str) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Yield order records from a .csv or .jsonl file, one at a time."""
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield _csv_record(row)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _coverage(value: str) -> ToppingCoverage:
+    return ToppingCoverage[value] if value in ToppingCoverage.__members__ else ToppingCoverage(value)
+
+
+def _amount(value: str) -> ToppingAmount:
+    return ToppingAmount[value] if value in ToppingAmount.__members__ else ToppingAmount(value)
+
+
+def _toppings(toppings) -> typing.List[typing.Tuple[str, ToppingCoverage, ToppingAmount]]:
+    """Toppings as [[code, coverage, amount], ...], or bare codes (full, normal)."""
+    ret = []
+    for topping in toppings or []:
+        if isinstance(topping, str):
+            topping = [topping]
+        code, coverage, amount = (list(topping) + ["full", "normal"][len(topping) - 1:])[:3]
+        ret.append((code, _coverage(coverage), _amount(amount)))
+    return ret
+
+
+def build_order(
+    record: typing.Dict[str, typing.Any], menus: MenuCache, stores: StoreCache
+) -> Order:
+    """Turn an order record into an Order, with its items and coupons added."""
+    customer = Customer(**record["customer"])
+    address = Address(**record["address"])
+    if record.get("store_id"):
+        store = Store({"StoreID": record["store_id"]}, country=address.country)
+    else:
+        store = stores.get_or_load(address)
+    menu: Menu = menus.get_or_load(store.id)
+    order = Order(store=store, customer=customer, address=address, country=address.country, menu=menu)
+    for item in record.get("items", []):
+        qty = int(item.get("qty", 1))
+        if item.get("preconf"):
+            order.add_item(menu.order_preconf_product(preconf_product_code=item["preconf"], qty=qty))
+        else:
+            order.add_item(
+                menu.order_product(
+                    product_code=item["product"],
+                    variant_code=item["variant"],
+                    toppings=_toppings(item.get("toppings")),
+                    qty=qty,
+                )
+            )
+    for coupon_code in record.get("coupons", []):
+        order.add_coupon(menu.get_coupon(coupon_code))
+    return order
+
+
+def card_from_record(record: typing.Dict[str, typing.Any]) -> typing.Optional[PaymentObject]:
+    """The record's card, or None to pay cash. Raises ValueError for a bad card."""
+    if not record.get("card"):
+        return None
+    card = PaymentObject(**record["card"])
+    errors = card.errors()
+    if errors:
+        raise ValueError(f"invalid card: {', '.join(errors)}")
+    return card
+
+
+def price_record(
+    index: int, record: typing.Dict[str, typing.Any], menus: MenuCache, stores: StoreCache
+) -> typing.Dict[str, typing.Any]:
+    """Build and price one record. Failures are reported, not raised."""
+    result: typing.Dict[str, typing.Any] = {"index": index, "id": record.get("id")}
+    try:
+        card = card_from_record(record)
+        order = build_order(record, menus, stores)
+        response = order.pay_with(card)
+    except Exception as e:
+        result.update(ok=False, error=f"{type(e).__name__}: {e}")
+        return result
+    result.update(
+        ok=True,
+        store_id=order.store.id,
+        status=response.get("Status"),
+        amounts=order.data.get("Amounts", {}),
+        estimated_wait=order.data.get("EstimatedWaitMinutes"),
+    )
+    return result
+
+
+class Checkpoint(object):
+    """Which input records are finished.
+
+    Stored as the index below which every record is done, plus the (at
+    most a window's worth of) finished records past it, so it stays small
+    however long the input is. Saved atomically after every result.
+    """
+
+    def __init__(self, path: typing.Optional[str]):
+        self.path = path
+        self.next_index = 0
+        self.done: typing.Set[int] = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.next_index = data["next_index"]
+            self.done = set(data["done"])
+
+    def is_done(self, index: int) -> bool:
+        return index < self.next_index or index in self.done
+
+    def mark(self, index: int):
+        self.done.add(index)
+        while self.next_index in self.done:
+            self.done.remove(self.next_index)
+            self.next_index += 1
+        if self.path:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"next_index": self.next_index, "done": sorted(self.done)}, f)
+            os.replace(tmp, self.path)
+
+
+def price_orders(
+    records: typing.Iterable[typing.Dict[str, typing.Any]],
+    output_path: str,
+    checkpoint_path: typing.Optional[str] = None,
+    max_workers: int = 8,
+    menus: typing.Optional[MenuCache] = None,
+    stores: typing.Optional[StoreCache] = None,
+    on_result: typing.Optional[typing.Callable[[typing.Dict[str, typing.Any]], None]] = None,
+) -> typing.Tuple[int, int]:
+    """Price every record, appending one JSON result per line to output_path.
+
+    At most max_workers orders are priced at once, and reading the input
+    only runs that far ahead. With a checkpoint_path, records finished by a
+    previous run are skipped. Returns (priced, failed) for this run.
+    """
+    menus = menus if menus is not None else MenuCache()
+    stores = stores if stores is not None else StoreCache()
+    checkpoint = Checkpoint(checkpoint_path)
+    lock = threading.Lock()
+    priced = failed = 0
+
+    with open(output_path, "a") as out, concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+
+        def finish(future: concurrent.futures.Future):
+            nonlocal priced, failed
+            result = future.result()
+            with lock:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                checkpoint.mark(result["index"])
+                if result["ok"]:
+                    priced += 1
+                else:
+                    failed += 1
+            if on_result is not None:
+                on_result(result)
+
+        in_flight: typing.Set[concurrent.futures.Future] = set()
+        try:
+            for index, record in enumerate(records):
+                if checkpoint.is_done(index):
+                    continue
+                if len(in_flight) >= max_workers:
+                    done, in_flight = concurrent.futures.wait(
+                        in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        finish(future)
+                in_flight.add(pool.submit(price_record, index, record, menus, stores))
+        finally:
+            # Even if reading the input blew up, record what's already being priced
+            for future in concurrent.futures.as_completed(in_flight):
+                finish(future)
+    return priced, failed
+
+
+def price_order_file(
+    input_path: str, output_path: str, checkpoint_path: typing.Optional[str] = None, **kwargs
+) -> typing.Tuple[int, int]:
+    """price_orders over read_orders(input_path). The checkpoint defaults to
+    output_path + ".checkpoint"."""
+    if checkpoint_path is None:
+        checkpoint_path = f"{output_path}.checkpoint"
+    return price_orders(read_orders(input_path), output_path, checkpoint_path=checkpoint_path, **kwargs)
@@ -0,0 +1,105 @@
+"""Warm up menus in a pre-forking server's parent, before the workers fork.
+
+    menus = prewarm(["4336", "4337", "4338"])
+    # ...fork workers (gunicorn's preload_app, multiprocessing "fork", ...)
+    menu = menus.get_or_load("4336")  # in a worker: no download, no parsing
+
+Otherwise every worker downloads and parses the same menus after it
+starts. Menus loaded here are inherited by the children, whose pages are
+shared with the parent copy-on-write until someone writes to them.
+prewarm() helps keep them from being written to:
+
+- gc.freeze() moves everything loaded so far out of the garbage
+  collector's reach, so collections in the children don't touch (and so
+  copy) the pages the menus live on.
+- With read_only=True (the default) each Menu's dicts are swapped for
+  read-only views, so a stray write raises TypeError instead of quietly
+  un-sharing a page - or worse, changing the menu for one worker only.
+  Menu.order_product, get_coupon and friends hand out copies, so ordering
+  works as usual. Products, variants and toppings inside a menu are still
+  plain objects: treat them as read-only too.
+
+Reference counting still writes to whatever objects a child touches, so
+expect some pages to be copied as menus are used; it's the download,
+parsing and the bulk of the memory that stay shared.
+
+Warm up after everything else that the parent loads, and before starting
+any threads that might be holding a lock when the workers fork. prewarm()
+waits for its own background requests (hedged reads) to finish before
+freezing. Children also start with fresh rate limiters and request
+stats (see ratelimit.LimiterRegistry and utils), so nothing the parent
+had in flight counts against them.
+"""
+from __future__ import annotations
+
+import gc
+import types
+import typing
+
+from .bulk import load_menus
+from .cache import MenuCache
+from .menu import Menu
+from .urls import COUNTRY_USA
+from .utils import wait_for_hedges
+
+_MENU_DICTS = ("variants", "products", "coupons", "preconfigured_products", "_all_toppings")
+
+
+def read_only_menu(menu: Menu) -> Menu:
+    """Swap menu's dicts for read-only views, in place, and build its
+    cached lookups now rather than in every child. Returns menu.
+
+    Read-only menus can't be pickled, so do this after any bulk parsing.
+    """
+    for name in _MENU_DICTS:
+        value = getattr(menu, name)
+        if isinstance(value, dict):
+            # Menu is frozen, which only stops assignment through setattr
+            object.__setattr__(menu, name, types.MappingProxyType(value))
+    menu.products_by_type
+    return menu
+
+
+def freeze():
+    """Collect garbage, then exempt every surviving object from future
+    collections (see gc.freeze), so they stay shared after fork."""
+    gc.collect()
+    gc.freeze()
+
+
+def prewarm(
+    store_ids: typing.Iterable[str] = (),
+    menu_data: typing.Optional[typing.Mapping[str, typing.Dict[str, typing.Any]]] = None,
+    lang: str = "en",
+    country: str = COUNTRY_USA,
+    cache: typing.Optional[MenuCache] = None,
+    processes: typing.Optional[int] = None,
+    fetch_workers: int = 8,
+    deadline=None,
+    read_only: bool = True,
+) -> MenuCache:
+    """Load menus into a MenuCache, and freeze them, ready to fork.
+
+    Menus for store_ids are downloaded (see bulk.load_menus); menu_data
+    maps store IDs to menus you already have, as the menu endpoint returns
+    them, which are parsed with Menu.from_menu_dict. The default cache
+    never expires entries, since children would reload an expired menu
+    each on their own.
+    """
+    store_ids = list(store_ids)
+    menus = load_menus(
+        store_ids, lang=lang, country=country, processes=processes, fetch_workers=fetch_workers, deadline=deadline
+    ) if store_ids else {}
+    for store_id, data in (menu_data or {}).items():
+        menus[str(store_id)] = Menu.from_menu_dict(data, country=country, store_id=str(store_id), lang=lang)
+    if cache is None:
+        cache = MenuCache(maxsize=max(256, len(menus)), ttl=float("inf"), lang=lang, country=country)
+    for store_id, menu in menus.items():
+        if read_only:
+            read_only_menu(menu)
+        else:
+            menu.products_by_type
+        cache.set(str(store_id), menu)
+    wait_for_hedges()
+    freeze()
+    return cache
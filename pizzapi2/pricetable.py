@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import typing
+
+import attr
+
+from .menu import Menu
+
+
+@attr.dataclass(frozen=True)
+class PriceRow(object):
+    store_id: str
+    variant_code: str
+    product_code: str
+    size_code: str
+    product_type: str
+    price: float
+    surcharge: float
+
+    @property
+    def total(self) -> float:
+        return self.price + self.surcharge
+
+
+class PriceTable(object):
+    """Variant prices across many stores, indexed by variant.
+
+    Each variant code maps to its row at every store that sells it, and
+    the cheapest of those rows is kept up to date as stores are added,
+    so cheapest() is a lookup and min_price_by_variant() is a lookup per
+    variant, instead of a walk over every Menu's variants. A variant's
+    rows are only scanned again when its cheapest store raises the price
+    or is removed.
+    """
+
+    def __init__(self, menus: typing.Optional[typing.Mapping[str, Menu]] = None):
+        # store ID -> {variant code: row}, and variant code -> {store ID: row}
+        self._stores: typing.Dict[str, typing.Dict[str, PriceRow]] = {}
+        self._by_variant: typing.Dict[str, typing.Dict[str, PriceRow]] = {}
+        self._by_type: typing.Dict[str, typing.Set[str]] = {}
+        # variant code -> its cheapest row with the surcharge, and without
+        self._cheapest: typing.Dict[str, typing.Tuple[PriceRow, PriceRow]] = {}
+        for store_id, menu in (menus or {}).items():
+            self.update(store_id, menu)
+
+    def _rescan(self, variant_code: str):
+        by_store = self._by_variant.get(variant_code)
+        if not by_store:
+            self._cheapest.pop(variant_code, None)
+            return
+        rows = by_store.values()
+        self._cheapest[variant_code] = (
+            min(rows, key=lambda row: row.price + row.surcharge),
+            min(rows, key=lambda row: row.price),
+        )
+
+    def _offer(self, row: PriceRow):
+        """Keep the cheapest rows right after row was added or changed."""
+        best = self._cheapest.get(row.variant_code)
+        if best is None:
+            self._cheapest[row.variant_code] = (row, row)
+            return
+        with_surcharge, without = best
+        if (with_surcharge.store_id == row.store_id and row.total > with_surcharge.total) or (
+            without.store_id == row.store_id and row.price > without.price
+        ):
+            # The cheapest store got dearer, someone else may be cheapest now
+            self._rescan(row.variant_code)
+            return
+        if row.total <= with_surcharge.total:
+            with_surcharge = row
+        if row.price <= without.price:
+            without = row
+        self._cheapest[row.variant_code] = (with_surcharge, without)
+
+    def update(self, store_id: str, menu: Menu):
+        """Add or refresh a single store's prices."""
+        store_id = str(store_id)
+        rows = {}
+        for variant in menu.variants.values():
+            product = menu.products.get(variant.product_code)
+            rows[variant.code] = PriceRow(
+                store_id=store_id,
+                variant_code=variant.code,
+                product_code=variant.product_code,
+                size_code=variant.size_code,
+                product_type=product.product_type if product else "",
+                price=variant.price,
+                surcharge=variant.surcharge,
+            )
+        for code in self._stores.get(store_id, {}).keys() - rows.keys():
+            self._remove_row(store_id, code)
+        for code, row in rows.items():
+            # Assigning over an existing entry keeps the store's place
+            self._by_variant.setdefault(code, {})[store_id] = row
+            self._by_type.setdefault(row.product_type, set()).add(code)
+            self._offer(row)
+        self._stores[store_id] = rows
+
+    def _remove_row(self, store_id: str, code: str):
+        by_store = self._by_variant[code]
+        del by_store[store_id]
+        if not by_store:
+            del self._by_variant[code]
+        if store_id in (row.store_id for row in self._cheapest.get(code, ())):
+            self._rescan(code)
+
+    def remove(self, store_id: str):
+        store_id = str(store_id)
+        for code in self._stores.pop(store_id):
+            self._remove_row(store_id, code)
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self._stores.values())
+
+    @property
+    def store_ids(self) -> typing.List[str]:
+        return list(self._stores)
+
+    def rows(
+        self,
+        variant_code: typing.Optional[str] = None,
+        product_type: typing.Optional[str] = None,
+        product_code: typing.Optional[str] = None,
+    ) -> typing.List[PriceRow]:
+        if variant_code is not None:
+            candidates = self._by_variant.get(variant_code, {}).values()
+        else:
+            candidates = (row for rows in self._stores.values() for row in rows.values())
+        return [
+            row
+            for row in candidates
+            if (product_type is None or row.product_type == product_type)
+            and (product_code is None or row.product_code == product_code)
+        ]
+
+    def min_price_by_variant(
+        self, product_type: typing.Optional[str] = None, include_surcharge: bool = True
+    ) -> typing.Dict[str, PriceRow]:
+        """The cheapest row for every variant code, across all stores."""
+        if product_type is None:
+            codes: typing.Iterable[str] = self._by_variant
+        else:
+            codes = [code for code in self._by_type.get(product_type, ()) if code in self._by_variant]
+        which = 0 if include_surcharge else 1
+        best = {}
+        for code in codes:
+            row = self._cheapest[code][which]
+            if product_type is None or row.product_type == product_type:
+                best[code] = row
+        return best
+
+    def cheapest(self, variant_code: str, include_surcharge: bool = True) -> typing.Optional[PriceRow]:
+        """The row for the store that sells variant_code for the least."""
+        best = self._cheapest.get(variant_code)
+        if best is None:
+            return None
+        return best[0] if include_surcharge else best[1]
+
+    def price_deltas(
+        self, reference_store: str, product_type: typing.Optional[str] = None
+    ) -> typing.Dict[str, typing.Dict[str, float]]:
+        """{store_id: {variant_code: price - reference price}}, for variants
+        the reference store also sells. Raises KeyError for a store that
+        isn't in the table."""
+        reference_store = str(reference_store)
+        if reference_store not in self._stores:
+            raise KeyError(f"No prices for store {reference_store}")
+        deltas: typing.Dict[str, typing.Dict[str, float]] = {
+            store_id: {} for store_id in self._stores if store_id != reference_store
+        }
+        for code, reference in self._stores[reference_store].items():
+            if product_type is not None and reference.product_type != product_type:
+                continue
+            for store_id, row in self._by_variant[code].items():
+                if store_id != reference_store:
+                    deltas[store_id][code] = row.price - reference.price
+        return deltas
@@ -0,0 +1,199 @@
+"""Opt-in, per-stage profiling of menu builds and order submission.
+
+Wrap the work you want measured in a profiling session:
+
+    profiler = Profiler(sample_rate=0.01, callback=print)
+    with profiler.session():
+        menu = store.get_menu()
+
+Inside a sampled session every instrumented stage (menu.fetch,
+menu.decode, menu.variants, ..., order.populate, order.encode,
+order.network, order.merge) is timed, counted and, with
+trace_memory=True, has its tracemalloc peak recorded. Outside a session,
+or in one that wasn't sampled, stage() costs one context variable lookup.
+
+tracemalloc is global to the process. Tracing runs while any session
+that asked for it is open, and only one stage at a time measures a peak:
+a stage that starts while another thread's stage is measuring gets
+peak_bytes=None. A peak also counts whatever other threads allocated
+meanwhile, so peaks are only exact with one session running at a time.
+"""
+import contextlib
+import contextvars
+import random
+import threading
+import time
+import typing
+
+_active: contextvars.ContextVar = contextvars.ContextVar("pizzapi2_profiler", default=None)
+
+# Sessions that want tracemalloc running, and whether we started it
+_tracing_lock = threading.Lock()
+_tracing_sessions = 0
+_started_tracing = False
+# Held by the stage measuring the tracemalloc peak
+_peak_lock = threading.Lock()
+
+
+def _start_tracing():
+    global _tracing_sessions, _started_tracing
+    import tracemalloc
+
+    with _tracing_lock:
+        if _tracing_sessions == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing_sessions += 1
+
+
+def _stop_tracing():
+    global _tracing_sessions, _started_tracing
+    import tracemalloc
+
+    with _tracing_lock:
+        _tracing_sessions -= 1
+        # Leave tracing alone if someone else started it
+        if _tracing_sessions == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class StageRecord(object):
+    """One run of one stage."""
+
+    __slots__ = ("name", "seconds", "count", "peak_bytes")
+
+    def __init__(self, name: str, seconds: float = 0.0, count: int = 0, peak_bytes: typing.Optional[int] = None):
+        self.name = name
+        self.seconds = seconds
+        self.count = count
+        self.peak_bytes = peak_bytes
+
+    def __repr__(self):
+        peak = "" if self.peak_bytes is None else f", peak={self.peak_bytes}B"
+        return f"StageRecord({self.name}: {self.seconds * 1000:.2f}ms, count={self.count}{peak})"
+
+
+class StageStats(object):
+    """Running totals for a stage across every sampled run."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.count = 0
+        self.peak_bytes: typing.Optional[int] = None
+
+    def add(self, record: StageRecord):
+        self.calls += 1
+        self.seconds += record.seconds
+        self.max_seconds = max(self.max_seconds, record.seconds)
+        self.count += record.count
+        if record.peak_bytes is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, record.peak_bytes)
+
+    def __repr__(self):
+        return (
+            f"StageStats(calls={self.calls}, seconds={self.seconds:.4f}, "
+            f"max_seconds={self.max_seconds:.4f}, count={self.count}, peak_bytes={self.peak_bytes})"
+        )
+
+
+class Profiler(object):
+    """Collects StageRecords from sampled sessions.
+
+    sample_rate is the fraction of sessions that are actually measured.
+    callback, if given, is called with each StageRecord as it finishes.
+    trace_memory turns on tracemalloc for sampled sessions (that's the
+    expensive part - keep the sample rate low with it in production).
+    Peaks of nested stages aren't separated; the instrumented stages don't nest.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 1.0,
+        trace_memory: bool = False,
+        callback: typing.Optional[typing.Callable[[StageRecord], None]] = None,
+    ):
+        self.sample_rate = sample_rate
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.stats: typing.Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: StageRecord):
+        with self._lock:
+            self.stats.setdefault(record.name, StageStats()).add(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    @contextlib.contextmanager
+    def session(self):
+        """Profile the stages run inside this block (if it's sampled)."""
+        if random.random() >= self.sample_rate:
+            yield self
+            return
+        trace_memory = self.trace_memory
+        if trace_memory:
+            _start_tracing()
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+            if trace_memory:
+                _stop_tracing()
+
+
+@contextlib.contextmanager
+def profile(sample_rate: float = 1.0, trace_memory: bool = False, callback=None):
+    """with profile() as profiler: ... - a one-off Profiler and session."""
+    profiler = Profiler(sample_rate=sample_rate, trace_memory=trace_memory, callback=callback)
+    with profiler.session():
+        yield profiler
+
+
+class _NullStage(object):
+    """What stage() hands out when nothing is being profiled."""
+
+    __slots__ = ()
+
+    count = 0
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_null_stage = _NullStage()
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time the block as stage `name`. Set .count on the yielded record to
+    say how many objects the stage produced."""
+    profiler = _active.get()
+    if profiler is None:
+        yield _null_stage
+        return
+    record = StageRecord(name)
+    tracemalloc = None
+    # Resetting the peak would wipe the one another stage is measuring
+    if profiler.trace_memory and _peak_lock.acquire(blocking=False):
+        import tracemalloc
+
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        if tracemalloc is not None:
+            if tracemalloc.is_tracing():
+                record.peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes
+            _peak_lock.release()
+        profiler.record(record)
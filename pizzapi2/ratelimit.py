@@ -0,0 +1,262 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+import typing
+import urllib.parse
+
+# Responses that mean "slow down"
+THROTTLE_STATUSES = (429, 503)
+
+
+async def _sleep(seconds: float):
+    # asyncio is only needed by asyncio users, so don't import it up front
+    import asyncio
+
+    await asyncio.sleep(seconds)
+
+
+class TokenBucket(object):
+    """Allows `rate` acquisitions per second on average, in bursts of up to `burst`.
+
+    Safe to share between threads; acquire_async is for asyncio tasks.
+    """
+
+    def __init__(self, rate: float, burst: typing.Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens if there are enough. Returns 0 on success, otherwise
+        how long to wait before there will be."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, timeout: typing.Optional[float] = None, tokens: float = 1.0) -> bool:
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if give_up is not None and time.monotonic() + wait > give_up:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: typing.Optional[float] = None, tokens: float = 1.0) -> bool:
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if give_up is not None and time.monotonic() + wait > give_up:
+                return False
+            await _sleep(wait)
+
+
+class AdaptiveConcurrency(object):
+    """Caps requests in flight, adjusting the cap AIMD-style.
+
+    Every healthy response raises the limit by 1/limit (about +1 per round
+    of requests). A throttled response (429/503, a timeout) or one much
+    slower than the usual latency cuts it by `backoff`, at most once per
+    usual round trip so a burst of 429s counts as one signal.
+    """
+
+    def __init__(
+        self,
+        initial: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        backoff: float = 0.5,
+        latency_tolerance: float = 3.0,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.baseline: typing.Optional[float] = None  # Slow moving average of healthy latency
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: typing.Optional[float] = None) -> bool:
+        with self._cond:
+            ok = self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout=timeout)
+            if ok:
+                self.in_flight += 1
+            return ok
+
+    async def acquire_async(self, timeout: typing.Optional[float] = None, poll: float = 0.01) -> bool:
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            if give_up is not None and time.monotonic() > give_up:
+                return False
+            await _sleep(poll)
+        return True
+
+    def release(self, latency: float, throttled: bool = False, sample: bool = True):
+        """Give the slot back. With sample=False the request says nothing
+        about the server (it failed on our side), so the limit is left alone."""
+        with self._cond:
+            self.in_flight -= 1
+            if not sample:
+                self._cond.notify_all()
+                return
+            now = time.monotonic()
+            slow = (
+                self.baseline is not None
+                and latency > self.baseline * self.latency_tolerance
+            )
+            if throttled or slow:
+                if now - self._last_decrease > (self.baseline or latency):
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.baseline = latency if self.baseline is None else 0.9 * self.baseline + 0.1 * latency
+            self._cond.notify_all()
+
+
+def _upstream_timeout(error: typing.Optional[BaseException]) -> bool:
+    """Whether error is the server taking too long to answer: a requests
+    timeout, not a TimeoutError from a Deadline."""
+    # Only requests can have raised one, so don't import it if it isn't loaded
+    requests = sys.modules.get("requests")
+    return error is not None and requests is not None and isinstance(error, requests.Timeout)
+
+
+class Slot(object):
+    """Handed out by Limiter.slot. Set status to the response status code so
+    the limiter can tell throttling from success."""
+
+    def __init__(self):
+        self.status: typing.Optional[int] = None
+        self.throttled = False
+
+
+class Limiter(object):
+    """An AdaptiveConcurrency for one host or endpoint, and optionally a
+    TokenBucket.
+
+    By default only the concurrency limit applies, and it adapts to what
+    the upstream tolerates. Pass rate (requests per second) to also cap
+    the request rate, for an upstream with a known quota. That cap is fixed.
+    """
+
+    def __init__(self, rate: typing.Optional[float] = None, burst: typing.Optional[float] = None, **concurrency):
+        self.bucket = TokenBucket(rate=rate, burst=burst) if rate is not None else None
+        self.concurrency = AdaptiveConcurrency(**concurrency)
+
+    def _finish(self, slot: Slot, start: float, error: typing.Optional[BaseException]):
+        timed_out = _upstream_timeout(error)
+        throttled = slot.throttled or slot.status in THROTTLE_STATUSES or timed_out
+        # Anything else that went wrong before a response (say the caller's
+        # own Deadline ran out) isn't the server's doing
+        sample = throttled or error is None or slot.status is not None
+        self.concurrency.release(time.monotonic() - start, throttled=throttled, sample=sample)
+
+    @contextlib.contextmanager
+    def slot(self, timeout: typing.Optional[float] = None):
+        """with limiter.slot(timeout) as slot: ... - waits for a token (if
+        there's a rate) and a free concurrency slot, or raises TimeoutError
+        after timeout seconds."""
+        give_up = None if timeout is None else time.monotonic() + timeout
+        if self.bucket is not None and not self.bucket.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for the rate limiter")
+        remaining = None if give_up is None else max(0.0, give_up - time.monotonic())
+        if not self.concurrency.acquire(timeout=remaining):
+            raise TimeoutError("Timed out waiting for a concurrency slot")
+        slot = Slot()
+        start = time.monotonic()
+        error = None
+        try:
+            yield slot
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(slot, start, error)
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self, timeout: typing.Optional[float] = None):
+        give_up = None if timeout is None else time.monotonic() + timeout
+        if self.bucket is not None and not await self.bucket.acquire_async(timeout=timeout):
+            raise TimeoutError("Timed out waiting for the rate limiter")
+        remaining = None if give_up is None else max(0.0, give_up - time.monotonic())
+        if not await self.concurrency.acquire_async(timeout=remaining):
+            raise TimeoutError("Timed out waiting for a concurrency slot")
+        slot = Slot()
+        start = time.monotonic()
+        error = None
+        try:
+            yield slot
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(slot, start, error)
+
+
+class LimiterRegistry(object):
+    """The Limiter to use for each endpoint.
+
+    Endpoints are the URL templates from the urls module. Settings can be
+    configured per endpoint or per host; anything not configured gets the
+    defaults. Each endpoint gets its own Limiter either way.
+    """
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._settings: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        self._limiters: typing.Dict[str, Limiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, endpoint_or_host: str, **settings):
+        """Set the Limiter arguments for a URL template or a host name.
+        Replaces any Limiter already made for it."""
+        with self._lock:
+            self._settings[endpoint_or_host] = settings
+            for endpoint in list(self._limiters):
+                if endpoint_or_host in (endpoint, urllib.parse.urlsplit(endpoint).netloc):
+                    del self._limiters[endpoint]
+
+    def _reset_after_fork(self):
+        # Limiters can be mid-request in the parent when it forks: their
+        # in-flight counts would never come down in the child, and a lock
+        # held by another thread would never be released. Start afresh,
+        # keeping the settings.
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    def for_url(self, endpoint: str) -> Limiter:
+        with self._lock:
+            limiter = self._limiters.get(endpoint)
+            if limiter is None:
+                host = urllib.parse.urlsplit(endpoint).netloc
+                settings = self._settings.get(endpoint, self._settings.get(host, self.defaults))
+                limiter = self._limiters[endpoint] = Limiter(**settings)
+            return limiter
+
+
+limiters = LimiterRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=limiters._reset_after_fork)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import bisect
+import typing
+
+import attr
+
+from .menu import Menu, Product, PreconfiguredProduct
+
+
+@attr.dataclass(frozen=True)
+class SearchMatch(object):
+    item: typing.Union[Product, PreconfiguredProduct]
+    score: int
+
+
+class BatchSearch(object):
+    """Search many menus for many queries at once.
+
+    Stores carry nearly the same products, so every distinct string (names,
+    product types, description words) is stored once, and every distinct
+    item - the tuple of strings it's matched on - is stored once across all
+    the menus. A query is scored against each unique string and each unique
+    item a single time, and the per-store results are just lookups.
+
+    Matching follows Menu.search: an item matches if its name, product type
+    or any word of its description scores above the threshold with
+    fuzz.ratio. Matches are ranked by their best score.
+    """
+
+    def __init__(self, menus: typing.Mapping[str, Menu]):
+        self._string_ids: typing.Dict[str, int] = {}
+        self.strings: typing.List[str] = []
+        self._signature_ids: typing.Dict[typing.Tuple[int, ...], int] = {}
+        self.signatures: typing.List[typing.Tuple[int, ...]] = []
+        self.stores: typing.Dict[str, typing.List[typing.Tuple[typing.Any, int]]] = {}
+        for store_id, menu in menus.items():
+            self.add_menu(store_id, menu)
+
+    def _string_id(self, value: str) -> int:
+        value = value.casefold()
+        sid = self._string_ids.get(value)
+        if sid is None:
+            sid = self._string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return sid
+
+    def _signature_id(self, fields: typing.Iterable[str]) -> int:
+        signature = tuple(sorted({self._string_id(field) for field in fields}))
+        sig_id = self._signature_ids.get(signature)
+        if sig_id is None:
+            sig_id = self._signature_ids[signature] = len(self.signatures)
+            self.signatures.append(signature)
+        return sig_id
+
+    def add_menu(self, store_id: str, menu: Menu):
+        """Index (or re-index) a single store's menu."""
+        items = []
+        for product in menu.products.values():
+            fields = [product.name, product.product_type, *product.description.split(" ")]
+            items.append((product, self._signature_id(fields)))
+        for product in menu.preconfigured_products.values():
+            fields = [product.name, *product.description.split(" ")]
+            items.append((product, self._signature_id(fields)))
+        self.stores[store_id] = items
+
+    def _score_signatures(self, query: str) -> typing.List[int]:
+        from fuzzywuzzy import fuzz
+
+        query = query.casefold()
+        string_scores = [fuzz.ratio(query, value) for value in self.strings]
+        return [
+            max((string_scores[sid] for sid in signature), default=0)
+            for signature in self.signatures
+        ]
+
+    def search(
+        self, queries: typing.Iterable[str], threshold: int, limit: typing.Optional[int] = None
+    ) -> typing.Dict[str, typing.Dict[str, typing.List[SearchMatch]]]:
+        """Returns {store_id: {query: [SearchMatch, ...]}}, best match first."""
+        results: typing.Dict[str, typing.Dict[str, typing.List[SearchMatch]]] = {
+            store_id: {} for store_id in self.stores
+        }
+        for query in dict.fromkeys(queries):
+            scores = self._score_signatures(query)
+            for store_id, items in self.stores.items():
+                matches = [
+                    SearchMatch(item=item, score=scores[sig_id])
+                    for item, sig_id in items
+                    if scores[sig_id] > threshold
+                ]
+                matches.sort(key=lambda match: match.score, reverse=True)
+                results[store_id][query] = matches[:limit] if limit else matches
+        return results
+
+
+def search_menus(
+    menus: typing.Mapping[str, Menu],
+    queries: typing.Iterable[str],
+    threshold: int,
+    limit: typing.Optional[int] = None,
+) -> typing.Dict[str, typing.Dict[str, typing.List[SearchMatch]]]:
+    """Shorthand for BatchSearch(menus).search(queries, threshold, limit)."""
+    return BatchSearch(menus).search(queries, threshold=threshold, limit=limit)
+
+
+class TypeAheadIndex(object):
+    """Prefix search over one menu's products, for search-as-you-type.
+
+    Every word of every product's name, code and product type goes into one
+    sorted list, so a prefix lookup is a bisect plus a short scan, however
+    big the menu is. With several words, each must prefix some word of the
+    product.
+    """
+
+    def __init__(self, menu: Menu):
+        self.items: typing.List[typing.Union[Product, PreconfiguredProduct]] = [
+            *menu.products.values(),
+            *menu.preconfigured_products.values(),
+        ]
+        entries = set()
+        for idx, item in enumerate(self.items):
+            words = [*item.name.split(), item.code]
+            if isinstance(item, Product):
+                words.append(item.product_type)
+            for word in words:
+                entries.add((word.casefold(), idx))
+        self._entries = sorted(entries)
+        self._words = [word for word, _ in self._entries]
+
+    def _matching(self, prefix: str) -> typing.Set[int]:
+        start = bisect.bisect_left(self._words, prefix)
+        end = bisect.bisect_left(self._words, prefix + "\uffff")
+        return {idx for _, idx in self._entries[start:end]}
+
+    def complete(self, text: str, limit: int = 10) -> typing.List[typing.Union[Product, PreconfiguredProduct]]:
+        prefixes = text.casefold().split()
+        if not prefixes:
+            return []
+        matches = self._matching(prefixes[0])
+        for prefix in prefixes[1:]:
+            if not matches:
+                break
+            matches &= self._matching(prefix)
+        text = text.casefold()
+        ranked = sorted(
+            matches,
+            key=lambda idx: (not self.items[idx].name.casefold().startswith(text), self.items[idx].name),
+        )
+        return [self.items[idx] for idx in ranked[:limit]]
@@ -0,0 +1,238 @@
+"""A small local HTTP service for store lookup, menus, search and pricing.
+
+    python -m pizzapi2.service --port 8080
+
+Endpoints (all JSON):
+
+    GET  /stores?street=...&city=...&region=...&zip=...[&service=Delivery]
+    GET  /stores/<store_id>/menu
+    GET  /stores/<store_id>/search?q=...[&threshold=70]
+    POST /price    an order record, as in pizzapi2.pipeline (422 with the
+                   price API's response if it rejects the order)
+
+Menus are loaded once per store and then shared, read-only, by every
+request; their JSON is encoded once too. Requests are handled on a
+fixed-size worker pool. Connections are closed after each response, and
+a client that goes quiet mid-request is dropped after request_timeout
+seconds, so idle clients can't tie up the workers.
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import http.server
+import json
+import typing
+import urllib.parse
+
+from .address import Address
+from .cache import LoadingCache, MenuCache, StoreCache
+from .menu import Menu
+from .order import PriceRejected
+from .pipeline import build_order, card_from_record
+
+
+def menu_to_dict(menu: Menu) -> typing.Dict[str, typing.Any]:
+    """A JSON-able summary of a menu: products by type, with their variants."""
+    return {
+        "store_id": menu.store_id,
+        "products": {
+            product_type: [
+                {
+                    "code": product.code,
+                    "name": product.name,
+                    "description": product.description,
+                    "toppings": list(product.available_toppings),
+                    "variants": [
+                        {"code": variant.code, "name": variant.name, "price": variant.price}
+                        for variant in product.variants.values()
+                    ],
+                }
+                for product in products
+            ]
+            for product_type, products in menu.products_by_type.items()
+        },
+        "preconfigured_products": [
+            {"code": product.code, "name": product.name, "description": product.description}
+            for product in menu.preconfigured_products.values()
+        ],
+        "coupons": [coupon.to_dict() for coupon in menu.coupons.values()],
+    }
+
+
+class MenuService(object):
+    """What the HTTP handlers call. Safe to share between threads."""
+
+    def __init__(self, menus: typing.Optional[MenuCache] = None, stores: typing.Optional[StoreCache] = None):
+        self.menus = menus if menus is not None else MenuCache()
+        self.stores = stores if stores is not None else StoreCache()
+        self._menu_json = LoadingCache(
+            lambda store_id: json.dumps(menu_to_dict(self.menus.get_or_load(store_id))).encode(),
+            maxsize=self.menus.maxsize,
+            ttl=self.menus.ttl,
+        )
+
+    def find_stores(self, street, city, region="", zip="", service="Delivery") -> typing.List[typing.Dict[str, typing.Any]]:
+        address = Address(street=street, city=city, region=region, zip=zip)
+        return [store.data for store in address.nearby_stores(service=service)]
+
+    def menu_json(self, store_id: str) -> bytes:
+        return self._menu_json.get_or_load(str(store_id))
+
+    def search(self, store_id: str, query: str, threshold: int = 70) -> typing.List[typing.Dict[str, str]]:
+        menu = self.menus.get_or_load(store_id)
+        # Menu.search lists a product once per matching word
+        matches = {item.code: item for item in menu.search(query, threshold=threshold)}
+        return [
+            {"code": item.code, "name": item.name, "description": item.description}
+            for item in matches.values()
+        ]
+
+    def price(self, record: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        card = card_from_record(record)
+        order = build_order(record, self.menus, self.stores)
+        return order.pay_with(card)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server: "MenuServer"
+    # HTTP/1.0: one request per connection. A keep-alive connection would
+    # hold a worker for as long as the client left it open.
+    protocol_version = "HTTP/1.0"
+
+    def setup(self):
+        # The socket timeout, so a client that connects and then says
+        # nothing gives up its worker
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def _reply(self, status: int, body: typing.Union[bytes, typing.Any]):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, route: typing.Callable[[], typing.Any]):
+        try:
+            self._reply(200, route())
+        except PriceRejected as e:
+            # The price API understood the order, and said no
+            self._reply(422, {"error": f"{type(e).__name__}: price rejected", "result": e.result})
+        except (KeyError, ValueError, TypeError) as e:
+            self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            response = getattr(e, "response", None)
+            status = 502 if response is not None else 500
+            self._reply(status, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        parts = [part for part in url.path.split("/") if part]
+        service = self.server.service
+        if parts == ["stores"]:
+            self._handle(lambda: service.find_stores(**query))
+        elif len(parts) == 3 and parts[0] == "stores" and parts[2] == "menu":
+            self._handle(lambda: service.menu_json(parts[1]))
+        elif len(parts) == 3 and parts[0] == "stores" and parts[2] == "search":
+            self._handle(
+                lambda: service.search(parts[1], query["q"], threshold=int(query.get("threshold", 70)))
+            )
+        else:
+            self._reply(404, {"error": f"No route for {url.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._reply(400, {"error": "Bad Content-Length"})
+            return
+        body = self.rfile.read(length)
+        if urllib.parse.urlsplit(self.path).path.rstrip("/") == "/price":
+            self._handle(lambda: self.server.service.price(json.loads(body)))
+        else:
+            self._reply(404, {"error": f"No route for {self.path}"})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class MenuServer(http.server.HTTPServer):
+    """An HTTPServer that handles connections on a fixed pool of worker
+    threads, rather than a new thread per connection."""
+
+    def __init__(
+        self,
+        address: typing.Tuple[str, int],
+        service: MenuService,
+        workers: int = 16,
+        verbose: bool = False,
+        request_timeout: float = 10.0,
+    ):
+        super().__init__(address, _Handler)
+        self.service = service
+        self.verbose = verbose
+        self.request_timeout = request_timeout
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pizzapi2-service")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Don't wait on connections still being read: request_timeout
+        # bounds how long those threads can last anyway
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: int = 16,
+    service: typing.Optional[MenuService] = None,
+    verbose: bool = True,
+    request_timeout: float = 10.0,
+):
+    server = MenuServer(
+        (host, port), service or MenuService(), workers=workers, verbose=verbose, request_timeout=request_timeout
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve pizzapi2 over local HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--request-timeout", type=float, default=10.0)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        verbose=not args.quiet,
+        request_timeout=args.request_timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -16,15 +16,15 @@ class Store(object):
         self.urls = Urls(country)
         self.data = data
 
-    def get_details(self):
-        details = request_json(self.urls.info_url(), store_id=self.id)
+    def get_details(self, deadline=None):
+        details = request_json(self.urls.info_url(), deadline=deadline, hedge=True, store_id=self.id)
         return details
 
-    def details_str(self):
-        details = self.get_details()
+    def details_str(self, deadline=None):
+        details = self.get_details(deadline=deadline)
         return f"{details['StreetName']}, {details['City']} ({details['Phone']})"
 
-    def get_menu(self, lang="en"):
-        response = request_json(self.urls.menu_url(), store_id=self.id, lang=lang)
-        menu = Menu.from_menu_dict(menu_data=response, country=self.country)
-        return menu
+    def get_menu(self, lang="en", deadline=None, catalog=None):
+        return Menu.from_store(
+            store_id=self.id, lang=lang, country=self.country, deadline=deadline, catalog=catalog
+        )
@@ -1,31 +1,548 @@
-import requests
-import xmltodict
+from __future__ import annotations
+
+import collections
+import functools
+import json
+import os
+import random
+import threading
+import time
+import typing
+
+from .ratelimit import THROTTLE_STATUSES, limiters
+
+# requests and xmltodict are imported where they're used, so that importing
+# pizzapi2 stays cheap (see pizzapi2/__init__.py).
+if typing.TYPE_CHECKING:
+    import concurrent.futures
+
+    import requests
+
+# Seconds allowed for a single request when the caller doesn't give a deadline.
+DEFAULT_TIMEOUT = 15.0
+# GETs are idempotent, so they get retried this many times on connection
+# errors, timeouts, 429s and 5xx responses.
+DEFAULT_RETRIES = 2
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 4.0
+# Hedge delay used until we've seen enough responses to estimate a p95.
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_HEDGE_SAMPLES = 20
+# Response bodies are read and decoded this many bytes at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class Deadline(object):
+    """A time budget shared by every request made on behalf of one operation.
+
+    Pass the same Deadline to each call in a flow (e.g. Order.pay_with and
+    Order.place) and every request gets whatever is left of the budget as
+    its timeout, instead of each one getting a fresh timeout of its own.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def coerce(cls, deadline: typing.Union["Deadline", float, None]) -> typing.Optional["Deadline"]:
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return cls(float(deadline))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, default: float = DEFAULT_TIMEOUT) -> float:
+        """The timeout to use for the next request, capped by the budget."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise TimeoutError(f"Deadline of {self.seconds}s exceeded")
+        return min(default, remaining)
+
+
+class LatencyTracker(object):
+    """Keeps recent response times per endpoint, to pick a hedge delay."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: typing.Dict[str, typing.Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = collections.deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def _reset_after_fork(self):
+        # Another thread may have held the lock when the process forked
+        self._lock = threading.Lock()
+
+    def percentile(self, key: str, pct: float = 95.0) -> typing.Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class TransferStats(object):
+    """Responses, bytes on the wire and decoded body bytes, per endpoint."""
+
+    def __init__(self):
+        self._totals: typing.Dict[str, typing.List[int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, wire_bytes: int, body_bytes: int):
+        with self._lock:
+            totals = self._totals.setdefault(key, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += wire_bytes
+            totals[2] += body_bytes
+
+    def get(self, key: str) -> typing.Tuple[int, int, int]:
+        """(responses, wire bytes, body bytes) for an endpoint."""
+        with self._lock:
+            return tuple(self._totals.get(key, (0, 0, 0)))
+
+    def items(self) -> typing.List[typing.Tuple[str, typing.Tuple[int, int, int]]]:
+        with self._lock:
+            return [(key, tuple(totals)) for key, totals in self._totals.items()]
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+    def _reset_after_fork(self):
+        # The child counts its own transfers
+        self._lock = threading.Lock()
+        self._totals = {}
+
+
+class TTLCache(object):
+    """A small thread-safe dict whose entries expire after ttl seconds.
+
+    Once maxsize is reached the oldest entry is evicted.
+    """
+
+    _missing = object()
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "collections.OrderedDict[typing.Hashable, typing.Tuple[float, typing.Any]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _entry(self, key: typing.Hashable):
+        # Call with the lock held
+        entry = self._data.get(key, self._missing)
+        if entry is not self._missing and entry[0] < time.monotonic():
+            del self._data[key]
+            return self._missing
+        return entry
+
+    def _store(self, key: typing.Hashable, value: typing.Any):
+        # Call with the lock held
+        self._data.pop(key, None)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        with self._lock:
+            entry = self._entry(key)
+        return default if entry is self._missing else entry[1]
+
+    def set(self, key: typing.Hashable, value: typing.Any):
+        with self._lock:
+            self._store(key, value)
+
+    def pop(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        with self._lock:
+            entry = self._data.pop(key, self._missing)
+        return default if entry is self._missing else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+latencies = LatencyTracker()
+transfers = TransferStats()
+# Threads running copies of hedged requests
+_hedge_threads: typing.Set[threading.Thread] = set()
+_hedge_threads_lock = threading.Lock()
+
+
+def _spawn(fn: typing.Callable, *args) -> "concurrent.futures.Future":
+    """fn(*args) on a thread of its own. Hedged requests aren't sent from
+    a pool, so they're never queued behind each other, however many are in
+    flight."""
+    import concurrent.futures
+
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def run():
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            with _hedge_threads_lock:
+                _hedge_threads.discard(thread)
+
+    thread = threading.Thread(target=run, name="pizzapi2-hedge", daemon=True)
+    with _hedge_threads_lock:
+        _hedge_threads.add(thread)
+    thread.start()
+    return future
+
+
+def wait_for_hedges():
+    """Wait for any hedged requests still running in the background (the
+    losers of a hedge, finishing up). Call before forking, so nothing is
+    mid-request when the process is copied."""
+    with _hedge_threads_lock:
+        threads = list(_hedge_threads)
+    for thread in threads:
+        thread.join()
+
+
+def _after_fork_in_child():
+    # A forked child inherits none of the parent's hedge threads, and any
+    # lock another thread held at the fork would stay held
+    global _hedge_threads_lock
+    _hedge_threads.clear()
+    _hedge_threads_lock = threading.Lock()
+    latencies._reset_after_fork()
+    transfers._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _timeout_for(deadline: typing.Optional[Deadline]) -> float:
+    return deadline.timeout() if deadline else DEFAULT_TIMEOUT
+
+
+def _is_retryable(exc: Exception) -> bool:
+    import requests
+
+    # ChunkedEncodingError: the connection dropped partway through the body
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500 or exc.response.status_code in THROTTLE_STATUSES
+    return False
+
+
+def _retry_after(exc: Exception) -> float:
+    """The server's Retry-After, in seconds, if it sent one."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get("Retry-After", 0))
+    except ValueError:  # An HTTP date - not worth parsing
+        return 0.0
+
+
+@functools.lru_cache(maxsize=None)
+def _accept_encoding() -> str:
+    # urllib3 can only decode brotli if one of these is installed
+    for module in ("brotli", "brotlicffi"):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        return "br, gzip, deflate"
+    return "gzip, deflate"
+
+
+def _read_bytes(chunks: typing.Iterator[bytes]) -> bytearray:
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+    return body
+
+
+def _iter_body(r: requests.Response) -> typing.Iterator[bytes]:
+    """The decompressed body as it arrives. Unlike r.iter_content, each
+    chunk is whatever has come in so far (up to CHUNK_SIZE), rather than
+    waiting for CHUNK_SIZE bytes, so a slow body can still be checked on
+    between chunks."""
+    import requests
+    from urllib3 import exceptions
+
+    if not hasattr(r.raw, "read1"):  # urllib3 < 2
+        yield from r.iter_content(CHUNK_SIZE)
+        return
+    # The same translation r.iter_content does
+    try:
+        while True:
+            chunk = r.raw.read1(CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+    except exceptions.ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except exceptions.DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e)
+    except exceptions.ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e)
+    except exceptions.SSLError as e:
+        raise requests.exceptions.SSLError(e)
+
+
+class _Cancelled(Exception):
+    """The other copy of a hedged request finished first."""
+
+
+def _get(
+    url: str,
+    key: str,
+    deadline: typing.Optional[Deadline],
+    read: typing.Callable[[typing.Iterator[bytes]], typing.Any] = _read_bytes,
+    on_send: typing.Optional[typing.Callable[[], None]] = None,
+    cancelled: typing.Optional[threading.Event] = None,
+) -> typing.Any:
+    """GET url, and return read(body), where body yields the decompressed
+    response in chunks as it arrives.
+
+    requests' timeout only bounds each socket read, so the deadline is
+    also checked between chunks. on_send is called just before the request
+    goes out (after waiting for the rate limiter), and once cancelled is
+    set the request gives up at its next chance.
+    """
+    import requests
+
+    def check():
+        if cancelled is not None and cancelled.is_set():
+            raise _Cancelled()
+        if deadline is not None and deadline.expired:
+            raise TimeoutError(f"Deadline of {deadline.seconds}s exceeded")
+
+    # Raises TimeoutError for a spent deadline before taking a slot
+    timeout = _timeout_for(deadline)
+    with limiters.for_url(key).slot(timeout=deadline.remaining() if deadline else None) as slot:
+        check()
+        if on_send is not None:
+            on_send()
+        r = requests.get(
+            url, timeout=timeout, headers={"Accept-Encoding": _accept_encoding()}, stream=True
+        )
+        slot.status = r.status_code
+        with r:
+            r.raise_for_status()
+            body_bytes = 0
+
+            def body() -> typing.Iterator[bytes]:
+                nonlocal body_bytes
+                for chunk in _iter_body(r):
+                    check()
+                    body_bytes += len(chunk)
+                    yield chunk
+
+            check()
+            value = read(body())
+            # tell() is what came off the socket, before decompression
+            transfers.record(key, r.raw.tell(), body_bytes)
+    return value
+
+
+def _hedged_get(
+    url: str,
+    key: str,
+    deadline: typing.Optional[Deadline],
+    read: typing.Callable[[typing.Iterator[bytes]], typing.Any] = _read_bytes,
+) -> typing.Any:
+    """Send the GET, and if it hasn't answered by the endpoint's p95, send
+    a second copy. Whichever finishes first wins.
+
+    Both copies run on threads of their own while the caller waits for
+    the first to succeed, so a copy that hangs waiting for headers (which
+    requests can't interrupt) doesn't hold the caller up. The delay counts
+    from when the first copy is actually sent, not from when it started
+    waiting for the rate limiter. The loser is left to stop at its next
+    chance: before it's sent, once its headers arrive, or between chunks
+    of its body.
+    """
+    import queue
+
+    delay = latencies.percentile(key) or DEFAULT_HEDGE_DELAY
+    cancelled = threading.Event()
+    finished: "queue.Queue[concurrent.futures.Future]" = queue.Queue()
+    lock = threading.Lock()
+    copies: typing.List["concurrent.futures.Future"] = []
+    timer: typing.Optional[threading.Timer] = None
+    closed = False
+
+    def send(on_send=None):
+        future = _spawn(_get, url, key, deadline, read, on_send, cancelled)
+        copies.append(future)
+        future.add_done_callback(finished.put)
+
+    def send_hedge():
+        with lock:
+            if not closed:
+                send()
+
+    def on_send():
+        nonlocal timer
+        with lock:
+            if closed:
+                return
+            timer = threading.Timer(min(delay, deadline.remaining()) if deadline else delay, send_hedge)
+            timer.daemon = True
+            timer.start()
+
+    def close():
+        nonlocal closed
+        closed = True
+        cancelled.set()
+        if timer is not None:
+            timer.cancel()
+
+    with lock:
+        send(on_send)
+    done = 0
+    error: typing.Optional[BaseException] = None
+    while True:
+        try:
+            future = finished.get(timeout=deadline.remaining() if deadline else None)
+        except queue.Empty:
+            with lock:
+                close()
+            raise TimeoutError(f"Deadline of {deadline.seconds}s exceeded")
+        done += 1
+        if future.exception() is None:
+            with lock:
+                close()
+            return future.result()
+        # The first copy to fail is the one to report
+        error = error or future.exception()
+        with lock:
+            # Once every copy sent has failed, don't send another
+            if done == len(copies):
+                close()
+                raise error
+
+
+def _get_with_retries(
+    url: str,
+    key: str,
+    deadline: typing.Optional[Deadline] = None,
+    retries: int = DEFAULT_RETRIES,
+    hedge: bool = False,
+    read: typing.Callable[[typing.Iterator[bytes]], typing.Any] = _read_bytes,
+) -> typing.Any:
+    """read(body) for a GET of url (see _get), retrying and hedging as
+    request_json describes."""
+    import requests
+
+    attempt = 0
+    while True:
+        start = time.monotonic()
+        try:
+            if hedge:
+                value = _hedged_get(url, key, deadline, read)
+            else:
+                value = _get(url, key, deadline, read)
+        except requests.RequestException as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            # Full jitter, so a fleet of clients doesn't retry in lockstep
+            backoff = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            backoff = max(backoff, _retry_after(e))
+            if deadline and backoff >= deadline.remaining():
+                raise
+            time.sleep(backoff)
+            attempt += 1
+            continue
+        latencies.record(key, time.monotonic() - start)
+        return value
+
 
-# TODO: Find out why this occasionally hangs
 # TODO: Can we wrap this up, so the callers don't have to worry about the
 # complexity of two types of requests?
-def request_json(url, **kwargs):
+def request_json(url, deadline=None, retries=DEFAULT_RETRIES, hedge=False, **kwargs):
     """Send a GET request to one of the API endpoints that returns JSON.
 
     Send a GET request to an endpoint, ideally a URL from the urls module.
     The endpoint is formatted with the kwargs passed to it.
 
+    Every request has a timeout, taken from the deadline (a Deadline or a
+    number of seconds) when one is given. Connection errors, timeouts, 429s
+    and 5xx responses are retried with jittered backoff. Requests go
+    through the endpoint's shared rate limiter (ratelimit.limiters), which
+    backs off when the API starts throttling. With hedge=True a
+    second request is sent if the first is slower than the endpoint's p95;
+    only use that for reads.
+
+    Responses are requested compressed (gzip, or brotli if it's installed)
+    and decompressed as they stream in; the sizes on the wire and decoded
+    are added up in utils.transfers. The JSON itself is buffered and
+    decoded whole: json.loads turns the bytes into a str before parsing,
+    so a body briefly needs its bytes plus its text in memory. Only
+    request_xml parses as the body arrives.
+
     This will error on an invalid request (requests.Request.raise_for_status()), but will otherwise return a dict.
     """
-    r = requests.get(url.format(**kwargs))
-    r.raise_for_status()
-    return r.json()
+    # There's no incremental JSON parser in the standard library, so the
+    # whole body is gathered first (and json.loads decodes it to a str)
+    return _get_with_retries(
+        url.format(**kwargs),
+        key=url,
+        deadline=Deadline.coerce(deadline),
+        retries=retries,
+        hedge=hedge,
+        read=lambda body: json.loads(_read_bytes(body)),
+    )
 
 
-def request_xml(url, **kwargs):
+def request_xml(url, deadline=None, retries=DEFAULT_RETRIES, hedge=False, **kwargs):
     """Send an XML request to one of the API endpoints that returns XML.
 
-    This is in every respect identical to request_json.
+    This is in every respect identical to request_json, except that the
+    body is parsed chunk by chunk as it arrives, never held whole.
+    """
+    import xmltodict
+
+    return _get_with_retries(
+        url.format(**kwargs),
+        key=url,
+        deadline=Deadline.coerce(deadline),
+        retries=retries,
+        hedge=hedge,
+        read=xmltodict.parse,
+    )
+
+
+def request_raw(url, deadline=None, retries=DEFAULT_RETRIES, hedge=False, **kwargs) -> bytearray:
+    """Like request_json, but returns the undecoded response body.
+
+    The body is the buffer it was read into, not a bytes copy of it.
+    Parsing it with json.loads still decodes it to a str whole, as
+    request_json does.
     """
-    r = requests.get(url.format(**kwargs))
-    r.raise_for_status()
-    return xmltodict.parse(r.text)
+    return _get_with_retries(
+        url.format(**kwargs), key=url, deadline=Deadline.coerce(deadline), retries=retries, hedge=hedge
+    )
 
 
 def yesno() -> bool:
-    return "y" in input("y/n").casefold()
\ No newline at end of file
+    return "y" in input("y/n").casefold()
@@ -0,0 +1,55 @@
+"""Small menus in the shape the menu endpoint returns, for tests."""
+
+
+def topping(code, name):
+    return {"Availability": [], "Code": code, "Description": "", "Local": False, "Name": name, "Tags": {}}
+
+
+def variant(code, product_code, size, price, name):
+    return {
+        "Code": code, "FlavorCode": "HANDTOSS", "ImageCode": "", "Local": False, "Name": name,
+        "Price": str(price), "ProductCode": product_code, "SizeCode": size, "Tags": {},
+        "AllowedCookingInstructions": "", "DefaultCookingInstructions": "", "Prepared": True,
+        "Pricing": {}, "Surcharge": "0",
+    }
+
+
+def product(code, product_type, name, description, variants, available="X=0:0.5:1:1.5,C=0:0.5:1:1.5,P=0:1,M=0:1",
+            default="X=1,C=1", sides="GARBUTTER", default_sides=""):
+    return {
+        "Code": code, "ProductType": product_type, "Name": name, "Description": description, "ImageCode": "",
+        "Local": False, "Tags": {}, "Variants": variants, "AvailableToppings": available,
+        "DefaultToppings": default, "AvailableSides": sides, "DefaultSides": default_sides,
+    }
+
+
+def make_menu(extra=5, price_bump=0.0):
+    """A hand tossed pizza in four sizes, wings, and `extra` specialty pizzas."""
+    toppings = {
+        "Pizza": {code: topping(code, name) for code, name in
+                  [("X", "Sauce"), ("C", "Cheese"), ("P", "Pepperoni"), ("M", "Mushrooms")]},
+        "Wings": {"SIDRAN": topping("SIDRAN", "Ranch")},
+    }
+    sides = {"Pizza": {"GARBUTTER": topping("GARBUTTER", "Garlic")}, "Wings": {"SIDRAN": topping("SIDRAN", "Ranch")}}
+    variants, products = {}, {}
+    for size, price in [("10", 9.99), ("12", 12.99), ("14", 14.99), ("16", 17.99)]:
+        variants[f"{size}SCREEN"] = variant(f"{size}SCREEN", "S_PIZZA", size, price + price_bump, f'{size}" Hand Tossed')
+    products["S_PIZZA"] = product("S_PIZZA", "Pizza", "Hand Tossed Pizza", "Garlic seasoned crust", list(variants))
+    variants["W08PHOTW"] = variant("W08PHOTW", "S_HOTWINGS", "8PCW", 8.99 + price_bump, "8-Piece Hot Wings")
+    products["S_HOTWINGS"] = product(
+        "S_HOTWINGS", "Wings", "Hot Buffalo Wings", "Wings with hot sauce", ["W08PHOTW"],
+        available="SIDRAN=0:1", default="", sides="SIDRAN", default_sides="SIDRAN=1",
+    )
+    for i in range(extra):
+        variants[f"14EX{i}"] = variant(f"14EX{i}", f"S_EX{i}", "14", 10 + i + price_bump, f"Extra {i}")
+        products[f"S_EX{i}"] = product(f"S_EX{i}", "Pizza", f"Specialty Pizza {i}", "With pepperoni", [f"14EX{i}"])
+    coupons = {
+        "9012": {"Code": "9012", "ImageCode": "", "Description": "Large 3 topping", "Name": "Large 3 Topping",
+                 "Price": "16.99", "Tags": {}, "Local": False, "Bundle": False},
+    }
+    preconfigured = {
+        "14SCEXTRAV": {"Code": "14SCEXTRAV", "Description": "Pepperoni Feast", "Name": "ExtravaganZZa", "Size": "14",
+                       "Options": "X=1,C=1", "ReferencedProductCode": "S_PIZZA", "Tags": {}},
+    }
+    return {"Variants": variants, "Toppings": toppings, "Sides": sides, "Products": products,
+            "Coupons": coupons, "PreconfiguredProducts": preconfigured}
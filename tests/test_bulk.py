@@ -0,0 +1,20 @@
+import json
+
+import pytest
+
+from menus import make_menu
+from pizzapi2.bulk import parse_menus
+
+
+def test_parse_menus():
+    menus = parse_menus({str(i): json.dumps(make_menu(extra=i)) for i in range(4)}, processes=2)
+    assert sorted(menus) == ["0", "1", "2", "3"]
+    assert menus["2"].store_id == "2"
+    assert len(menus["3"].products) == 5
+
+
+def test_parse_menus_raises_for_a_bad_payload():
+    payloads = {"bad": b"{not json"}
+    payloads.update({str(i): json.dumps(make_menu()) for i in range(10)})
+    with pytest.raises(ValueError):
+        parse_menus(payloads, processes=2)
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from pizzapi2.cache import LoadingCache
+
+
+def test_concurrent_misses_load_once():
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        time.sleep(0.1)
+        return key * 2
+
+    cache = LoadingCache(load)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load(21))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 8
+    assert loads == [21]
+
+
+def test_least_recently_used_is_evicted_and_entries_expire():
+    cache = LoadingCache(lambda key: key, maxsize=2, ttl=0.2)
+    cache.get_or_load("a")
+    cache.get_or_load("b")
+    cache.get_or_load("a")
+    cache.set("c", "c")
+    assert cache.pop("b") is None
+    assert cache.get_or_load("a", loader=lambda key: "reloaded") == "a"
+    time.sleep(0.3)
+    assert cache.get_or_load("a", loader=lambda key: "reloaded") == "reloaded"
+
+
+def test_get_keeps_the_ttlcache_contract():
+    cache = LoadingCache(lambda key: "loaded")
+    assert cache.get("a", "fallback") == "fallback"
+    assert cache.get("a") is None
+    assert cache.get_or_load("a") == "loaded"
+    assert cache.get("a", "fallback") == "loaded"
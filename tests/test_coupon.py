@@ -0,0 +1,40 @@
+import pytest
+import requests
+
+from menus import make_menu
+from pizzapi2 import coupon
+from pizzapi2.coupon import CouponDetailService
+from pizzapi2.menu import Menu
+
+
+def fake_request_json(url, deadline=None, hedge=False, couponid=None, **kwargs):
+    if couponid == "BAD":
+        raise requests.HTTPError("500 Server Error")
+    if couponid == "SLOW":
+        raise TimeoutError("Deadline of 1s exceeded")
+    return {"Code": couponid}
+
+
+def test_get_many_reports_failed_coupons(monkeypatch):
+    monkeypatch.setattr(coupon, "request_json", fake_request_json)
+    errors = []
+    details = CouponDetailService().get_many("7", ["9012", "BAD"], on_error=lambda *args: errors.append(args))
+    assert details == {"9012": {"Code": "9012"}}
+    assert [code for code, _ in errors] == ["BAD"]
+    assert isinstance(errors[0][1], requests.HTTPError)
+
+
+def test_get_many_raises_when_the_deadline_runs_out(monkeypatch):
+    monkeypatch.setattr(coupon, "request_json", fake_request_json)
+    with pytest.raises(TimeoutError):
+        CouponDetailService().get_many("7", ["9012", "SLOW"])
+
+
+def test_get_coupon_details_raises_on_failure(monkeypatch):
+    monkeypatch.setattr(coupon, "request_json", fake_request_json)
+    menu = Menu.from_menu_dict(make_menu(), "USA", store_id="7")
+    service = CouponDetailService()
+    assert menu.get_coupon("9012", details=True, service=service).details == {"Code": "9012"}
+    menu.coupons["BAD"] = menu.coupons["9012"]
+    with pytest.raises(requests.HTTPError):
+        menu.get_coupon("BAD", details=True, service=service)
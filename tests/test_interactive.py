@@ -0,0 +1,26 @@
+import concurrent.futures
+import time
+
+from pizzapi2.interactive import start_menu_fetch
+
+
+class FakeStore(object):
+    def details_str(self):
+        time.sleep(0.1)
+        return "Store 7"
+
+    def get_menu(self):
+        time.sleep(0.1)
+        return "menu"
+
+
+class FakeAddress(object):
+    def closest_store(self, ignore_closed=True):
+        return FakeStore()
+
+
+def test_start_menu_fetch_on_a_single_worker():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        future = start_menu_fetch(FakeAddress(), pool)
+        menu, store, details = future.result(timeout=5)
+    assert (menu, details) == ("menu", "Store 7")
@@ -0,0 +1,32 @@
+import copy
+import pickle
+import types
+
+import pytest
+
+from menus import make_menu
+from pizzapi2.menu import Menu, ToppingAmount, ToppingCoverage
+
+
+def test_shared_topping_mappings_are_read_only():
+    menu = Menu.from_menu_dict(make_menu(), "USA", store_id="7")
+    first, second = menu.products["S_EX0"], menu.products["S_EX1"]
+    assert first.available_toppings is second.available_toppings
+    with pytest.raises(TypeError):
+        first.available_toppings["Z"] = first.available_toppings["X"]
+    with pytest.raises(TypeError):
+        del first.available_sides["GARBUTTER"]
+
+
+def test_menus_still_pickle_and_keep_sharing():
+    menu = pickle.loads(pickle.dumps(Menu.from_menu_dict(make_menu(), "USA", store_id="7")))
+    first, second = menu.products["S_EX0"], menu.products["S_EX1"]
+    assert first.available_toppings is second.available_toppings
+    assert sorted(first.available_toppings) == ["C", "M", "P", "X"]
+    assert menu.order_product(product_code="S_EX0", variant_code="14EX0", toppings=[("P", ToppingCoverage.full, ToppingAmount.normal)]).code == "14EX0"
+    assert copy.deepcopy(first) == first
+
+
+def test_mapping_proxies_still_dont_pickle():
+    with pytest.raises(TypeError):
+        pickle.dumps(types.MappingProxyType({"a": 1}))
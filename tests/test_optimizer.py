@@ -0,0 +1,46 @@
+import pytest
+
+from menus import make_menu
+from pizzapi2.address import Address
+from pizzapi2.customer import Customer
+from pizzapi2.menu import Menu
+from pizzapi2.optimizer import best_carts, confirm
+from pizzapi2.order import Order
+from pizzapi2.store import Store
+
+
+def confirm_carts(monkeypatch, coupons=(), on_rejected=None):
+    menu = Menu.from_menu_dict(make_menu(), "USA", store_id="7")
+    carts = best_carts(menu, 4, top=3)
+    sent = []
+
+    def send(order, url, merge, deadline=None, data=None):
+        sent.append(order)
+        codes = [product["Code"] for product in order.data["Products"]]
+        # Reject anything with the cheapest specialty pizza in it
+        if "14EX0" in codes:
+            return {"Status": -1, "StatusItems": [{"Code": "ProductUnavailable"}]}
+        order.data["Amounts"] = {"Customer": 5.0 * len(codes)}
+        return {"Status": 0, "Order": order.data}
+
+    monkeypatch.setattr(Order, "_send", send)
+    confirmed = confirm(
+        carts, menu, Store({"StoreID": 7}), Customer("A", "B", "a@b.c", "5555555555"),
+        Address("1 Main St", "Springfield", "IL", "62701"), coupons=coupons, on_rejected=on_rejected,
+    )
+    return carts, confirmed, sent
+
+
+def test_confirm_reports_rejected_carts(monkeypatch):
+    rejected = []
+    carts, confirmed, _ = confirm_carts(monkeypatch, coupons=["9012"], on_rejected=lambda *args: rejected.append(args))
+    rejects = [cart for cart in carts if any(item.variant_code == "14EX0" for item in cart.items)]
+    assert rejects
+    assert [cart for cart, _ in rejected] == rejects
+    assert rejected[0][1].result["StatusItems"] == [{"Code": "ProductUnavailable"}]
+    assert len(confirmed) == len(carts) - len(rejects)
+
+
+def test_confirm_checks_coupons_first(monkeypatch):
+    with pytest.raises(KeyError, match="NOPE"):
+        confirm_carts(monkeypatch, coupons=["9012", "NOPE"])
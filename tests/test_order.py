@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from menus import make_menu
+from pizzapi2.address import Address
+from pizzapi2.customer import Customer
+from pizzapi2.menu import Menu
+from pizzapi2.order import Order
+from pizzapi2.store import Store
+
+DELAY = 0.1
+
+
+class FakePriceAPI(object):
+    """Stands in for Order._send. Records every request, and can make the
+    background (speculative, merge=False) ones slow or fail."""
+
+    def __init__(self, speculative_delay=0.0, speculative_error=None):
+        self.speculative_delay = speculative_delay
+        self.speculative_error = speculative_error
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, order, url, merge, deadline=None, data=None):
+        data = order.data if data is None else data
+        codes = [product["Code"] for product in data["Products"]]
+        with self.lock:
+            self.calls.append(("fresh" if merge else "speculative", codes))
+        if not merge:
+            time.sleep(self.speculative_delay)
+            if self.speculative_error is not None:
+                raise self.speculative_error
+        response = {"Status": 0, "Order": dict(data, Amounts={"Customer": 10.0 * len(codes)})}
+        if merge:
+            order._merge(response)
+        return response
+
+    def kinds(self):
+        with self.lock:
+            return [kind for kind, _ in self.calls]
+
+
+@pytest.fixture
+def menu():
+    return Menu.from_menu_dict(make_menu(), "USA", store_id="7")
+
+
+def make_order(monkeypatch, menu, api):
+    monkeypatch.setattr(Order, "_send", lambda order, *args, **kwargs: api(order, *args, **kwargs))
+    return Order(
+        Store({"StoreID": 7}), Customer("A", "B", "a@b.c", "5555555555"),
+        Address("1 Main St", "Springfield", "IL", "62701"), menu=menu, speculate=True, speculate_delay=DELAY,
+    )
+
+
+def pizza(menu, size="14"):
+    return menu.order_product("S_PIZZA", f"{size}SCREEN", [])
+
+
+def test_changes_within_the_delay_make_one_request(monkeypatch, menu):
+    api = FakePriceAPI()
+    order = make_order(monkeypatch, menu, api)
+    for size in ("10", "12", "14"):
+        order.add_item(pizza(menu, size))
+        time.sleep(DELAY / 4)
+    time.sleep(DELAY * 3)
+    assert api.calls == [("speculative", ["10SCREEN", "12SCREEN", "14SCREEN"])]
+
+
+def test_pay_with_reuses_the_speculative_price(monkeypatch, menu):
+    api = FakePriceAPI()
+    order = make_order(monkeypatch, menu, api)
+    order.add_item(pizza(menu))
+    time.sleep(DELAY * 3)
+    response = order.pay_with()
+    assert api.kinds() == ["speculative"]
+    assert [product["Code"] for product in response["Order"]["Products"]] == ["14SCREEN"]
+    assert order.data["Amounts"] == {"Customer": 10.0}
+    assert order.data["Payments"] == [{"Type": "Cash"}]
+
+
+def test_a_change_while_pricing_prices_again(monkeypatch, menu):
+    api = FakePriceAPI(speculative_delay=DELAY * 3)
+    order = make_order(monkeypatch, menu, api)
+    order.add_item(pizza(menu))
+    # Let the first speculative request go out, then change the cart under it
+    time.sleep(DELAY * 1.5)
+    order.add_item(pizza(menu, "16"))
+    response = order.pay_with()
+    assert [product["Code"] for product in response["Order"]["Products"]] == ["14SCREEN", "16SCREEN"]
+    assert order.data["Amounts"] == {"Customer": 20.0}
+    assert ("fresh", ["14SCREEN", "16SCREEN"]) in api.calls
+
+
+def test_a_stale_speculative_price_is_discarded(monkeypatch, menu):
+    api = FakePriceAPI(speculative_delay=DELAY * 3)
+    order = make_order(monkeypatch, menu, api)
+    order.add_item(pizza(menu))
+    time.sleep(DELAY * 1.5)
+    order.add_item(pizza(menu, "16"))
+    # Both speculative requests in flight; the stale one answers first
+    time.sleep(DELAY * 1.5)
+    response = order.pay_with()
+    assert api.kinds() == ["speculative", "speculative"]
+    assert [product["Code"] for product in response["Order"]["Products"]] == ["14SCREEN", "16SCREEN"]
+    assert order.data["Amounts"] == {"Customer": 20.0}
+
+
+def test_a_failed_speculative_price_falls_back_to_a_fresh_one(monkeypatch, menu):
+    api = FakePriceAPI(speculative_error=ConnectionError("reset"))
+    order = make_order(monkeypatch, menu, api)
+    order.add_item(pizza(menu))
+    time.sleep(DELAY * 3)
+    response = order.pay_with()
+    assert api.kinds() == ["speculative", "fresh"]
+    assert response["Status"] == 0
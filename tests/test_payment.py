@@ -0,0 +1,75 @@
+import datetime
+import random
+import re
+
+import pytest
+
+from pizzapi2.payment import PaymentObject, card_type, luhn_valid
+
+# The regexes card_type replaced, first match wins
+OLD_PATTERNS = {
+    "VISA": r"^4[0-9]{12}(?:[0-9]{3})?$",
+    "MASTERCARD": r"^5[1-5][0-9]{14}$",
+    "AMEX": r"^3[47][0-9]{13}$",
+    "DINERS": r"^3(?:0[0-5]|[68][0-9])[0-9]{11}$",
+    "DISCOVER": r"^6(?:011|5[0-9]{2})[0-9]{12}$",
+    "JCB": r"^(?:2131|1800|35\d{3})\d{11}$",
+    "ENROUTE": r"^(?:2014|2149)\d{11}$",
+}
+
+
+def old_card_type(number):
+    return next((name for name, pattern in OLD_PATTERNS.items() if re.match(pattern, number)), "")
+
+
+def test_card_type_matches_the_old_regexes():
+    rnd = random.Random(39)
+    prefixes = ["", "4", "5", "51", "55", "56", "34", "37", "30", "305", "306", "36", "38", "6011", "65", "64",
+                "2131", "1800", "35", "2014", "2149", "2150"]
+    numbers = ["", "4" * 16, "41111111111111a1", "４111111111111111"]
+    for _ in range(20000):
+        prefix = rnd.choice(prefixes)
+        length = rnd.randint(max(len(prefix), 1), 17)
+        numbers.append(prefix + "".join(rnd.choice("0123456789") for _ in range(length - len(prefix))))
+    for number in numbers:
+        assert card_type(number) == old_card_type(number), number
+
+
+@pytest.mark.parametrize("number, valid", [
+    ("4111111111111111", True),
+    ("4111111111111112", False),
+    ("378282246310005", True),
+    ("5555555555554444", True),
+    ("5555555555554445", False),
+    ("", False),
+    ("41111a", False),
+])
+def test_luhn(number, valid):
+    assert luhn_valid(number) is valid
+
+
+@pytest.mark.parametrize("expiration, expired", [
+    ("1226", False),
+    ("10/26", False),
+    ("0926", True),
+    ("1225", True),
+    ("0130", False),
+])
+def test_expiration(expiration, expired):
+    card = PaymentObject("4111111111111111", expiration, "123", "12345")
+    errors = card.errors(today=datetime.date(2026, 10, 19))
+    assert errors == (["card has expired"] if expired else [])
+
+
+def test_errors_lists_every_problem():
+    card = PaymentObject("4111111111111112", "1326", "12", "1234")
+    assert card.errors(today=datetime.date(2026, 10, 19)) == [
+        "card number fails checksum",
+        "expiration should be MMYY",
+        "CVV should be 3 or 4 digits",
+        "billing zip should be 5 or 9 digits",
+    ]
+    assert not card.validate()
+    assert PaymentObject("1234", "1226", "123", "12345").errors(today=datetime.date(2026, 10, 19)) == [
+        "unrecognized card number"
+    ]
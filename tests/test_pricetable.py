@@ -0,0 +1,49 @@
+import pytest
+
+from menus import make_menu
+from pizzapi2.menu import Menu
+from pizzapi2.pricetable import PriceTable
+
+
+def build_table():
+    return PriceTable({
+        str(store_id): Menu.from_menu_dict(make_menu(price_bump=bump), "USA", store_id=str(store_id))
+        for store_id, bump in [(1, 1.0), (2, 0.0), (3, 2.5)]
+    })
+
+
+def test_cheapest():
+    table = build_table()
+    row = table.cheapest("14SCREEN")
+    assert row.store_id == "2"
+    assert row.price == pytest.approx(14.99)
+    assert table.cheapest("NOPE") is None
+    assert [row.store_id for row in table.rows(variant_code="W08PHOTW", product_type="Wings")] == ["1", "2", "3"]
+    assert table.rows(variant_code="W08PHOTW", product_type="Pizza") == []
+
+
+def test_cheapest_after_update():
+    table = build_table()
+    table.remove("2")
+    assert table.cheapest("14SCREEN").store_id == "1"
+    table.update("4", Menu.from_menu_dict(make_menu(price_bump=-1.0), "USA", store_id="4"))
+    assert table.cheapest("14SCREEN").store_id == "4"
+
+
+def test_price_deltas():
+    table = build_table()
+    deltas = table.price_deltas("2", product_type="Wings")
+    assert deltas["1"] == {"W08PHOTW": pytest.approx(1.0)}
+    assert deltas["3"] == {"W08PHOTW": pytest.approx(2.5)}
+    assert "2" not in deltas
+    with pytest.raises(KeyError):
+        table.price_deltas("99")
+
+
+def test_cheapest_store_raising_its_prices():
+    table = build_table()
+    table.update("2", Menu.from_menu_dict(make_menu(price_bump=5.0), "USA", store_id="2"))
+    assert table.cheapest("14SCREEN").store_id == "1"
+    assert table.min_price_by_variant(product_type="Wings")["W08PHOTW"].store_id == "1"
+    table.remove("1")
+    assert table.cheapest("14SCREEN").store_id == "3"
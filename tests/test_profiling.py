@@ -0,0 +1,39 @@
+import threading
+import tracemalloc
+
+from pizzapi2.profiling import Profiler, stage
+
+
+def test_tracing_outlives_the_session_that_started_it():
+    first, second = Profiler(trace_memory=True), Profiler(trace_memory=True)
+    started, finished = threading.Event(), threading.Event()
+    records = []
+
+    def other_session():
+        with second.session():
+            started.set()
+            finished.wait(5)
+            with stage("late") as record:
+                data = [0] * 100000
+            records.append(record)
+            del data
+
+    thread = threading.Thread(target=other_session)
+    with first.session():
+        thread.start()
+        started.wait(5)
+    finished.set()
+    thread.join()
+    assert records[0].peak_bytes > 100000 * 4
+    assert not tracemalloc.is_tracing()
+
+
+def test_only_one_stage_measures_the_peak():
+    profiler = Profiler(trace_memory=True)
+    with profiler.session():
+        with stage("outer") as outer:
+            with stage("inner") as inner:
+                data = [0] * 100000
+            del data
+    assert outer.peak_bytes > 100000 * 4
+    assert inner.peak_bytes is None
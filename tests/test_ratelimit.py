@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+import requests
+
+from pizzapi2.ratelimit import Limiter, limiters
+from pizzapi2.utils import Deadline
+
+
+def test_expired_deadlines_dont_cut_the_limit():
+    limiter = Limiter(initial=8)
+    for _ in range(3):
+        with pytest.raises(TimeoutError):
+            with limiter.slot():
+                Deadline(0).timeout()
+    assert limiter.concurrency.limit == 8
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_upstream_timeouts_and_429s_are_throttling():
+    limiter = Limiter(initial=8)
+    with pytest.raises(requests.Timeout):
+        with limiter.slot():
+            raise requests.ReadTimeout()
+    assert limiter.concurrency.limit == 4
+
+    limiter = Limiter(initial=8)
+    with limiter.slot() as slot:
+        slot.status = 429
+    assert limiter.concurrency.limit == 4
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_children_start_with_fresh_limiters():
+    url = "https://example.invalid/fork"
+    with limiters.for_url(url).slot():
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if limiters.for_url(url).concurrency.in_flight == 0 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert limiters.for_url(url).concurrency.in_flight == 0
+
+
+def test_no_rate_cap_unless_asked_for():
+    limiter = Limiter()
+    assert limiter.bucket is None
+    start = time.monotonic()
+    for _ in range(100):
+        with limiter.slot(timeout=1):
+            pass
+    assert time.monotonic() - start < 0.5
+
+    limiter = Limiter(rate=10, burst=1)
+    with limiter.slot():
+        pass
+    with pytest.raises(TimeoutError):
+        with limiter.slot(timeout=0.01):
+            pass
@@ -0,0 +1,89 @@
+import http.client
+import json
+import socket
+import threading
+import time
+
+from pizzapi2.order import PriceRejected
+from pizzapi2.service import MenuServer
+
+
+class FakeService(object):
+    def menu_json(self, store_id):
+        return b'{"store_id": "%s"}' % store_id.encode()
+
+    def price(self, record):
+        raise PriceRejected({"Status": -1, "StatusItems": [{"Code": "Warning"}]})
+
+
+def start_server(workers, request_timeout):
+    server = MenuServer(("127.0.0.1", 0), FakeService(), workers=workers, request_timeout=request_timeout)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def get_menu(port, store_id, timeout=5):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    conn.request("GET", f"/stores/{store_id}/menu")
+    response = conn.getresponse()
+    return conn, response.status, response.read()
+
+
+def test_idle_keep_alive_clients_dont_hold_workers():
+    server = start_server(workers=2, request_timeout=30)
+    port = server.server_address[1]
+    try:
+        # More clients than workers, each leaving its connection open
+        idle = [get_menu(port, str(i))[0] for i in range(4)]
+        start = time.monotonic()
+        conn, status, body = get_menu(port, "7", timeout=2)
+        assert status == 200
+        assert body == b'{"store_id": "7"}'
+        assert time.monotonic() - start < 1
+        for c in idle + [conn]:
+            c.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_silent_clients_time_out():
+    server = start_server(workers=2, request_timeout=0.3)
+    port = server.server_address[1]
+    silent = [socket.create_connection(("127.0.0.1", port)) for _ in range(3)]
+    try:
+        conn, status, _ = get_menu(port, "7", timeout=5)
+        assert status == 200
+        conn.close()
+    finally:
+        start = time.monotonic()
+        server.shutdown()
+        server.server_close()
+        # Shutting down doesn't wait on connections that are still open
+        assert time.monotonic() - start < 1
+        for sock in silent:
+            sock.close()
+
+
+def post_price(port, body, headers):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("POST", "/price", body=body, headers=headers)
+    response = conn.getresponse()
+    result = response.status, json.loads(response.read())
+    conn.close()
+    return result
+
+
+def test_price_errors():
+    server = start_server(workers=2, request_timeout=5)
+    port = server.server_address[1]
+    try:
+        status, body = post_price(port, b"{}", {})
+        assert status == 422
+        assert body["result"]["Status"] == -1
+        status, body = post_price(port, b"{}", {"Content-Length": "lots"})
+        assert status == 400
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,103 @@
+import concurrent.futures
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+from pizzapi2 import utils
+from pizzapi2.ratelimit import limiters
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+    hits = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.hits.append(self.path)
+            first = self.hits.count(self.path) == 1
+        if self.path.startswith("/slow-body") and first:
+            # 200KB, trickled out over 5 seconds
+            self.send_response(200)
+            self.send_header("Content-Length", "200000")
+            self.end_headers()
+            for _ in range(100):
+                try:
+                    self.wfile.write(b" " * 2000)
+                    self.wfile.flush()
+                except OSError:
+                    return
+                time.sleep(0.05)
+            return
+        if self.path.startswith("/stall") and first:
+            # Nothing at all, not even headers, for 5 seconds
+            time.sleep(5)
+        if self.path.startswith("/sleep"):
+            time.sleep(0.3)
+        body = json.dumps({"first": first}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(http.server.ThreadingHTTPServer):
+    request_queue_size = 128
+    daemon_threads = True
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_hedge_wins_over_a_slow_body(base_url, monkeypatch):
+    monkeypatch.setattr(utils, "DEFAULT_HEDGE_DELAY", 0.2)
+    url = base_url + "/slow-body/hedge"
+    start = time.monotonic()
+    assert utils.request_json(url, hedge=True) == {"first": False}
+    assert time.monotonic() - start < 1.5
+    # The losing copy gives its slot back
+    time.sleep(0.2)
+    assert limiters.for_url(url).concurrency.in_flight == 0
+
+
+def test_hedge_wins_over_a_stalled_request(base_url, monkeypatch):
+    monkeypatch.setattr(utils, "DEFAULT_HEDGE_DELAY", 0.2)
+    start = time.monotonic()
+    assert utils.request_json(base_url + "/stall", hedge=True) == {"first": False}
+    assert time.monotonic() - start < 1.0
+
+
+def test_hedged_reads_arent_capped_by_the_hedge_pool(base_url, monkeypatch):
+    monkeypatch.setattr(utils, "DEFAULT_HEDGE_DELAY", 5.0)
+    url = base_url + "/sleep"
+    limiters.configure(url, initial=64, max_limit=64)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=40) as pool:
+        start = time.monotonic()
+        list(pool.map(lambda _: utils.request_json(url, hedge=True), range(40)))
+    # 40 requests of 0.3s each, all at once - not 16 at a time
+    assert time.monotonic() - start < 0.9
+
+
+def test_deadline_bounds_a_slow_body(base_url):
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        utils.request_raw(base_url + "/slow-body/deadline", deadline=0.5, retries=0)
+    assert time.monotonic() - start < 1.0
+
+
+def test_request_raw_returns_the_buffer_it_read(base_url):
+    body = utils.request_raw(base_url + "/raw")
+    assert isinstance(body, bytearray)
+    assert json.loads(body) == {"first": True}